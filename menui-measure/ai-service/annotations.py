@@ -0,0 +1,228 @@
+"""
+Rendu différé des images annotées.
+
+/analyze ne dessine plus l'image annotée avant de répondre : il enregistre
+une description (image source, coins du marqueur, suggestions) et renvoie
+l'URL définitive. L'image est produite en tâche de fond, ou au premier GET
+de cette URL, à une taille et un encodage configurables.
+"""
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from imageinfo import REDUCED_DECODE_FLAGS, read_image_header
+from metrics import StageTimer
+from storage import ShardedDirectory
+
+ANNOTATION_FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+ANNOTATION_MODES = ("sync", "background", "lazy")
+
+_FILENAME = re.compile(r"^(annotated_[0-9a-f]{32})(_thumb)?(\.jpg|\.webp)$")
+
+
+def draw_annotations(image: np.ndarray, marker_corners: Optional[np.ndarray],
+                     suggestions: List[Dict[str, Any]]) -> np.ndarray:
+    """Dessiner le marqueur et les suggestions sur une copie de l'image."""
+    annotated = image.copy()
+
+    # Dessiner le marqueur A4 si détecté
+    if marker_corners is not None:
+        cv2.drawContours(annotated, [marker_corners.astype(int)], -1, (0, 255, 0), 3)
+
+        # Ajouter des labels aux coins
+        for i, corner in enumerate(marker_corners):
+            cv2.circle(annotated, tuple(corner.astype(int)), 8, (0, 255, 0), -1)
+            cv2.putText(annotated, f"C{i+1}", tuple(corner.astype(int) + 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+    # Dessiner les suggestions
+    for suggestion in suggestions:
+        points = np.asarray(suggestion["mask_poly"]).astype(np.int32)
+        color = (255, 0, 0) if suggestion["type"] == "area" else (0, 0, 255)
+
+        if suggestion["type"] == "area":
+            cv2.drawContours(annotated, [points], -1, color, 2)
+        else:
+            cv2.polylines(annotated, [points], False, color, 2)
+
+        # Ajouter un label de confiance
+        center = np.mean(points, axis=0).astype(int)
+        cv2.putText(annotated, f"{suggestion['confidence']:.2f}", tuple(center),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+    return annotated
+
+
+class AnnotationRenderer:
+    """
+    Images annotées de `store`, rendues à partir de leur description.
+
+    Les descriptions sont dans `<racine>/.pending` (même répartition que les
+    images) ; elles sont conservées après le rendu pour pouvoir produire la
+    miniature plus tard.
+
+    - `sync` : rendu pendant l'analyse (comportement historique).
+    - `background` : rendu après la réponse, si un worker est libre.
+    - `lazy` : rendu uniquement au premier GET de l'URL.
+
+    Dans les deux derniers modes, un GET arrivant avant le rendu le déclenche.
+    """
+
+    def __init__(
+        self,
+        store: ShardedDirectory,
+        url_prefix: str = "/processed",
+        mode: str = "background",
+        image_format: str = "jpeg",
+        quality: int = 85,
+        max_side: int = 2048,
+        thumbnail_side: int = 320,
+    ):
+        if mode not in ANNOTATION_MODES:
+            raise ValueError(f"Mode d'annotation inconnu: {mode}")
+        if image_format not in ANNOTATION_FORMATS:
+            raise ValueError(f"Format d'annotation inconnu: {image_format}")
+        self.store = store
+        self.specs = ShardedDirectory(store.root / ".pending")
+        self.url_prefix = url_prefix
+        self.mode = mode
+        self.image_format = image_format
+        self.extension = ANNOTATION_FORMATS[image_format]
+        self.quality = max(1, min(100, quality))
+        self.max_side = max_side
+        self.thumbnail_side = thumbnail_side
+
+    @classmethod
+    def from_env(cls, store: ShardedDirectory, url_prefix: str = "/processed") -> "AnnotationRenderer":
+        """Construire le moteur de rendu à partir des variables d'environnement AI_ANNOTATED_*."""
+        return cls(
+            store=store,
+            url_prefix=url_prefix,
+            mode=os.getenv("AI_ANNOTATED_MODE", "background"),
+            image_format=os.getenv("AI_ANNOTATED_FORMAT", "jpeg"),
+            quality=int(os.getenv("AI_ANNOTATED_QUALITY", "85")),
+            max_side=int(os.getenv("AI_ANNOTATED_MAX_SIDE", "2048")),
+            thumbnail_side=int(os.getenv("AI_ANNOTATED_THUMB_SIDE", "320")),
+        )
+
+    def filename(self, name: str, thumbnail: bool = False) -> str:
+        return f"{name}{'_thumb' if thumbnail else ''}{self.extension}"
+
+    def url(self, name: str, thumbnail: bool = False) -> str:
+        return f"{self.url_prefix}/{self.filename(name, thumbnail)}"
+
+    def parse(self, filename: str) -> Optional[Tuple[str, bool, str]]:
+        """
+        (nom, miniature, extension) pour un nom de fichier annoté, sinon None.
+        Les deux formats sont acceptés : les URL déjà renvoyées restent
+        valides si AI_ANNOTATED_FORMAT change.
+        """
+        match = _FILENAME.match(filename)
+        if match is None:
+            return None
+        return match.group(1), match.group(2) is not None, match.group(3)
+
+    def _spec_path(self, name: str) -> Optional[Path]:
+        return self.specs.locate(f"{name}.json")
+
+    def create(self, source: str, marker_corners: Optional[List[List[float]]],
+               suggestions: List[Dict[str, Any]]) -> str:
+        """
+        Enregistrer la description d'une image annotée et retourner son nom.
+        Les coordonnées sont celles de l'image source d'origine.
+        """
+        name = f"annotated_{uuid.uuid4().hex}"
+        spec = {
+            "source": str(source),
+            "marker_corners": marker_corners,
+            "suggestions": [
+                {key: suggestion[key] for key in ("mask_poly", "type", "confidence")}
+                for suggestion in suggestions
+            ],
+        }
+        spec_path = self.specs.create_path(f"{name}.json")
+        tmp_path = spec_path.with_name(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(spec, f)
+        os.replace(tmp_path, spec_path)
+        return name
+
+    def available(self, name: str) -> bool:
+        """L'image est déjà rendue ou peut l'être."""
+        return self.store.locate(self.filename(name)) is not None or self._spec_path(name) is not None
+
+    def render(self, filename: str,
+               loader: Callable[[str, int], Optional[np.ndarray]],
+               timer: Optional[StageTimer] = None) -> bool:
+        """
+        Produire le fichier `filename` (image ou miniature) à partir de sa
+        description. `loader(path, flags)` décode l'image source.
+        Retourne False si la description ou la source est introuvable.
+        """
+        timer = timer or StageTimer()
+        parsed = self.parse(filename)
+        if parsed is None:
+            return False
+        name, thumbnail, extension = parsed
+        spec_path = self._spec_path(name)
+        if spec_path is None:
+            return False
+        try:
+            with open(spec_path, "r", encoding="utf-8") as f:
+                spec = json.load(f)
+            header = read_image_header(spec["source"], 512 * 1024)
+        except (OSError, ValueError):
+            return False
+
+        # Décoder à l'échelle réduite la plus petite couvrant la taille de sortie
+        side = self.thumbnail_side if thumbnail else self.max_side
+        factor = 1
+        if side > 0 and header is not None and header.width and header.height:
+            longest = max(header.width, header.height)
+            factor = max(f for f in REDUCED_DECODE_FLAGS if f == 1 or longest / f >= side)
+        with timer.stage("annotation_decode"):
+            image = loader(spec["source"], REDUCED_DECODE_FLAGS[factor])
+        if image is None:
+            return False
+
+        with timer.stage("annotation_draw"):
+            # Coordonnées d'origine -> image rendue
+            scale = 1.0
+            if side > 0 and max(image.shape[:2]) > side:
+                scale = side / max(image.shape[:2])
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            def to_output(points: Any) -> np.ndarray:
+                return (np.asarray(points, dtype=np.float64) - (factor - 1) / 2.0) / factor * scale
+
+            marker_corners = spec["marker_corners"]
+            annotated = draw_annotations(
+                image,
+                to_output(marker_corners) if marker_corners is not None else None,
+                [{**suggestion, "mask_poly": to_output(suggestion["mask_poly"])}
+                 for suggestion in spec["suggestions"]],
+            )
+
+        with timer.stage("annotation_encode"):
+            if extension == ".webp":
+                params = [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+            else:
+                params = [cv2.IMWRITE_JPEG_QUALITY, self.quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+            ok, encoded = cv2.imencode(extension, annotated, params)
+        if not ok:
+            return False
+
+        # Écriture atomique : deux rendus concurrents du même fichier sont sans effet
+        with timer.stage("annotation_write"):
+            path = self.store.create_path(filename)
+            tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(encoded.tobytes())
+            os.replace(tmp_path, path)
+        return True
@@ -0,0 +1,622 @@
+"""
+Banc d'essai reproductible du pipeline d'analyse.
+
+Génère des scènes synthétiques (feuille A4 et objet de dimensions connues,
+en perspective, à différentes résolutions, bruit, éclairage et encombrement),
+puis mesure :
+
+- le temps des étapes (`detect_a4_marker`, `suggest_measurements`,
+  `annotate_image` et le rendu de l'image annotée) ;
+- le temps de `/analyze` et `/warp` à travers l'application ASGI, et le débit
+  de `/analyze` à plusieurs niveaux de concurrence ;
+- la durée du préchauffage et de la première analyse une fois `/ready` ouvert ;
+- le pic de mémoire (RSS) du service et de ses workers ;
+- l'erreur des coins détectés et des mesures par rapport à la vérité terrain ;
+- la présence de l'objet parmi les suggestions et l'erreur de la surface
+  mesurée sur sa suggestion (`preliminary_measurements` pour `/analyze`).
+
+Le code de sortie est 1 si une erreur dépasse les seuils, ou si une latence
+médiane (ou le préchauffage) dépasse celle de la référence (`--baseline`)
+de plus de `--max-slowdown`.
+
+    python benchmark.py --quick
+    python benchmark.py --save-baseline benchmark-baseline.json
+    python benchmark.py --baseline benchmark-baseline.json --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Les résultats en cache fausseraient les mesures de /analyze, et le
+# nettoyage du stockage ne doit pas tourner pendant les mesures
+os.environ.setdefault("AI_CACHE_ENABLED", "0")
+os.environ.setdefault("AI_STORAGE_GC_INTERVAL_MINUTES", "0")
+
+import cv2
+import httpx
+import numpy as np
+
+import main
+from storage import artifact_key
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+A4_MM = (210.0, 297.0)
+# Objet posé à côté de la feuille : rectangle de dimensions connues (mm)
+OBJECT_ORIGIN_MM = (260.0, 60.0)
+OBJECT_SIZE_MM = (150.0, 90.0)
+# Recouvrement minimal (IoU) d'une suggestion "area" avec l'objet pour qu'il compte comme trouvé
+SUGGESTION_MIN_IOU = 0.5
+
+
+class SceneConfig(NamedTuple):
+    name: str
+    megapixels: float
+    tilt: float = 0.0        # raccourcissement du bord haut (fraction de la largeur)
+    noise: float = 4.0       # écart-type du bruit gaussien
+    lighting: float = 0.0    # amplitude du dégradé d'éclairage (0 à 1)
+    clutter: int = 0         # nombre d'objets parasites
+    seed: int = 0
+
+
+# Balayage en résolution : mêmes conditions à chaque taille, seule la
+# résolution change. Une feuille non détectée est signalée comme régression,
+# les conditions ne sont pas ajustées pour la faire passer.
+SWEEP_CONDITIONS = {"tilt": 0.08, "noise": 6.0, "clutter": 40, "seed": 1}
+SCENES = [
+    SceneConfig(f"{megapixels}mp-tilt", megapixels, **SWEEP_CONDITIONS)
+    for megapixels in (2, 12, 24, 48)
+] + [
+    # Variantes à 12 Mpx, une seule condition modifiée à la fois
+    SceneConfig("12mp-flat", 12, **{**SWEEP_CONDITIONS, "tilt": 0.0}),
+    SceneConfig("12mp-dim", 12, **{**SWEEP_CONDITIONS, "noise": 10.0, "lighting": 0.5}),
+    SceneConfig("12mp-clutter", 12, **{**SWEEP_CONDITIONS, "clutter": 80}),
+]
+QUICK_SCENES = SCENES[:2]
+
+
+class Scene(NamedTuple):
+    config: SceneConfig
+    image: np.ndarray
+    corners: np.ndarray          # coins de la feuille, haut-gauche puis sens horaire
+    object_points: np.ndarray    # coins de l'objet, même ordre
+
+
+def render_scene(config: SceneConfig) -> Scene:
+    """
+    Dessiner une scène : le plan de la table (en mm) est projeté dans l'image
+    par une homographie connue, ce qui donne la vérité terrain exacte.
+    """
+    rng = np.random.default_rng(config.seed)
+    width = int(round(np.sqrt(config.megapixels * 1e6 * 4 / 3)))
+    height = int(round(width * 3 / 4))
+
+    # Plan (mm) -> image de face, puis trapèze pour simuler l'inclinaison
+    scale = 0.3 * width / A4_MM[0]
+    front = np.array([[scale, 0, 0.15 * width], [0, scale, 0.12 * height], [0, 0, 1]])
+    frame = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    shift = config.tilt * width
+    tilted = np.float32([[shift, 0], [width - shift, 0], [width, height], [0, height]])
+    H = cv2.getPerspectiveTransform(frame, tilted) @ front
+
+    def project(points_mm: np.ndarray) -> np.ndarray:
+        return cv2.perspectiveTransform(
+            np.asarray(points_mm, dtype=np.float64).reshape(-1, 1, 2), H
+        ).reshape(-1, 2)
+
+    def rectangle(x: float, y: float, w: float, h: float) -> np.ndarray:
+        return np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+
+    # Table unie (le bruit du capteur est ajouté à la fin)
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = (60, 70, 80)
+
+    # Objets parasites hors de la feuille
+    for _ in range(config.clutter):
+        x, y = rng.uniform(-60, 600), rng.uniform(-60, 380)
+        if -20 < x < A4_MM[0] + 20 and -20 < y < A4_MM[1] + 20:
+            continue
+        size = rng.uniform(5, 40)
+        color = tuple(int(c) for c in rng.integers(0, 200, 3))
+        polygon = project(rectangle(x, y, size, size * rng.uniform(0.3, 1)))
+        cv2.fillPoly(image, [np.round(polygon).astype(np.int32)], color, cv2.LINE_AA)
+
+    corners = project(rectangle(0, 0, *A4_MM))
+    object_points = project(rectangle(*OBJECT_ORIGIN_MM, *OBJECT_SIZE_MM))
+    # Sous-pixel : fillPoly avec 4 bits fractionnaires
+    cv2.fillPoly(image, [np.round(corners * 16).astype(np.int32)], (245, 245, 245), cv2.LINE_AA, 4)
+    cv2.fillPoly(image, [np.round(object_points * 16).astype(np.int32)], (150, 20, 20), cv2.LINE_AA, 4)
+
+    # Éclairage non uniforme (dégradé horizontal) et bruit du capteur
+    if config.lighting > 0:
+        gradient = np.linspace(1 - config.lighting, 1, width, dtype=np.float32)
+        image = (image * gradient[None, :, None]).astype(np.uint8)
+    if config.noise > 0:
+        noise = rng.normal(0, config.noise, (height, width, 1)).astype(np.float32)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+
+    return Scene(config, image, corners, object_points)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p90/p99/max en millisecondes."""
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+        "n": len(samples),
+    }
+
+
+def time_call(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    fn()  # chauffe
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def peak_rss_mb(pid: str = "self") -> Optional[float]:
+    """Pic de mémoire résidente d'un processus (VmHWM), en Mo."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == "self" and resource is not None:
+        unit = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
+    return None
+
+
+def worker_peak_rss_mb() -> Optional[float]:
+    """
+    Pic de mémoire du plus gros worker du pool, lu avant son arrêt
+    (RUSAGE_CHILDREN n'est pas fiable pour des processus lancés par spawn).
+    """
+    processes = getattr(main.executor._pool, "_processes", None) or {}
+    peaks = [peak for peak in (peak_rss_mb(str(pid)) for pid in processes) if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def polygon_iou(a: np.ndarray, b: np.ndarray) -> float:
+    """IoU de deux polygones (enveloppes convexes), en pixels de l'image."""
+    a = cv2.convexHull(np.asarray(a, dtype=np.float32).reshape(-1, 1, 2))
+    b = cv2.convexHull(np.asarray(b, dtype=np.float32).reshape(-1, 1, 2))
+    intersection, _ = cv2.intersectConvexConvex(a, b)
+    union = cv2.contourArea(a) + cv2.contourArea(b) - intersection
+    return float(intersection / union) if union > 0 else 0.0
+
+
+def suggestion_accuracy(scene: Scene, corners: np.ndarray, suggestions: List[Dict[str, Any]],
+                        measurements: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    L'objet est-il suggéré (suggestion "area" recouvrant l'objet à au moins
+    SUGGESTION_MIN_IOU), et avec quelle erreur de surface. La surface est
+    lue dans `measurements` (preliminary_measurements de /analyze) si fourni,
+    sinon mesurée à partir des coins.
+    """
+    best, best_iou = None, 0.0
+    for i, suggestion in enumerate(suggestions):
+        if suggestion["type"] != "area" or len(suggestion["mask_poly"]) < 3:
+            continue
+        iou = polygon_iou(suggestion["mask_poly"], scene.object_points)
+        if iou > best_iou:
+            best, best_iou = i, iou
+    if best is None or best_iou < SUGGESTION_MIN_IOU:
+        return {"object_suggested": False, "object_iou": best_iou}
+
+    if measurements is not None:
+        measured = next((m for m in measurements if m["id"] == best), None)
+        if measured is None:
+            return {"object_suggested": False, "object_iou": best_iou}
+    else:
+        polygon = np.asarray(suggestions[best]["mask_poly"], dtype=np.float64)
+        measured = main.measure_shapes(corners, [polygon], ["area"],
+                                       corner_sigma_px=main.CORNER_SIGMA_PX)[0]
+    true_area = OBJECT_SIZE_MM[0] * OBJECT_SIZE_MM[1]
+    return {
+        "object_suggested": True,
+        "object_iou": best_iou,
+        "object_area_error_pct": 100 * abs(measured["value_mm2"] - true_area) / true_area,
+    }
+
+
+def accuracy(scene: Scene, corners: Optional[Any], pixels_per_mm: Optional[float],
+             suggestions: Optional[List[Dict[str, Any]]] = None,
+             measurements: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Erreur des coins détectés (en mm sur la feuille) et des mesures de
+    l'objet calculées à partir de ces coins ; avec `suggestions`, celle de
+    la suggestion de l'objet (voir suggestion_accuracy).
+    """
+    if corners is None:
+        return {"detected": False}
+    corners = np.asarray(corners, dtype=np.float64)
+    corner_error_px = float(np.linalg.norm(corners - scene.corners, axis=1).max())
+
+    obj = scene.object_points
+    lengths = main.measure_shapes(
+        corners,
+        [obj[:2], obj[1:3], obj],
+        ["length", "length", "area"],
+        corner_sigma_px=main.CORNER_SIGMA_PX,
+    )
+    true_width, true_height = OBJECT_SIZE_MM
+    true_area = true_width * true_height
+    return {
+        "detected": True,
+        "corner_error_px": corner_error_px,
+        "corner_error_mm": corner_error_px / pixels_per_mm,
+        "length_error_pct": 100 * max(
+            abs(lengths[0]["value_mm"] - true_width) / true_width,
+            abs(lengths[1]["value_mm"] - true_height) / true_height,
+        ),
+        "area_error_pct": 100 * abs(lengths[2]["value_mm2"] - true_area) / true_area,
+        **(suggestion_accuracy(scene, corners, suggestions, measurements) if suggestions is not None else {}),
+    }
+
+
+def remove_annotation(name: str) -> None:
+    renderer = main.annotation_renderer
+    for thumbnail in (False, True):
+        main.storage.processed.remove(renderer.filename(name, thumbnail))
+    renderer.specs.remove(f"{name}.json")
+    main.storage.refs.remove(name)
+
+
+def bench_stages(scene: Scene, image_path: Path, repeat: int) -> Dict[str, Any]:
+    """Temps des étapes du pipeline, appelées directement sur l'image décodée."""
+    image = scene.image
+    detection = main.detect_a4_marker(image)
+    result: Dict[str, Any] = {"detect_a4_marker": time_call(lambda: main.detect_a4_marker(image), repeat)}
+    if detection is None:
+        result["accuracy"] = {"detected": False}
+        return result
+
+    corners, pixels_per_mm = detection
+    suggestions = main.suggest_measurements(image, pixels_per_mm, corners)
+    result["accuracy"] = accuracy(
+        scene, corners, pixels_per_mm, [suggestion.model_dump() for suggestion in suggestions]
+    )
+    # Écart d'échelle à une détection en pleine résolution (voir detect_a4_marker)
+    full = main.find_a4_quad(image, min_area=main.MARKER_MIN_AREA_PX)
+    if full is not None:
+        reference = main.compute_pixels_per_mm(full.astype(np.float32))
+        result["accuracy"]["scale_vs_full_pct"] = 100 * abs(pixels_per_mm - reference) / reference
+    result["suggest_measurements"] = time_call(
+        lambda: main.suggest_measurements(image, pixels_per_mm, corners), repeat
+    )
+
+    names = []
+
+    def annotate() -> None:
+        names.append(main.annotate_image(str(image_path), corners.tolist(), suggestions))
+
+    result["annotate_image"] = time_call(annotate, repeat)
+
+    def render() -> None:
+        filename = main.annotation_renderer.filename(names[-1])
+        main.storage.processed.remove(filename)
+        main.render_annotation(filename)
+
+    result["render_annotation"] = time_call(render, repeat)
+    for name in names:
+        remove_annotation(name)
+    return result
+
+
+class ServiceBench:
+    """Requêtes vers l'application ASGI, sans serveur HTTP ni réseau."""
+
+    def __init__(self):
+        self.worker_peak_rss_mb: Optional[float] = None
+        self.client = httpx.AsyncClient(app=main.app, base_url="http://bench", timeout=600)
+        self.uploads: List[str] = []
+        self.annotations: List[str] = []
+        self.startup: Dict[str, Any] = {}
+
+    async def __aenter__(self) -> "ServiceBench":
+        await main.app.router.startup()
+        # Mesurer le service préchauffé, comme derrière un répartiteur qui attend /ready
+        while (response := await self.client.get("/ready")).status_code != 200:
+            await asyncio.sleep(0.05)
+        self.startup = response.json()["startup"]
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.client.aclose()
+        self.worker_peak_rss_mb = worker_peak_rss_mb()
+        await main.app.router.shutdown()
+        for name in self.uploads:
+            main.storage.uploads.remove(name)
+        for url in self.annotations:
+            parsed = main.annotation_renderer.parse(Path(url).name)
+            if parsed is not None:
+                remove_annotation(parsed[0])
+
+    async def analyze(self, payload: bytes) -> Dict[str, Any]:
+        response = await self.client.post(
+            "/analyze", files={"file": ("bench.jpg", payload, "image/jpeg")}
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data.get("image_path"):
+            self.uploads.append(data["image_path"])
+        self.annotations.append(data["annotated_image_url"])
+        return data
+
+    async def warp(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self.client.post("/warp", json=body)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("warped_image_url"):
+            name = Path(data["warped_image_url"]).name
+            main.storage.processed.remove(name)
+            main.storage.refs.remove(artifact_key(name))
+        return data
+
+    async def timed(self, coroutine_fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+        await coroutine_fn()  # chauffe
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await coroutine_fn()
+            samples.append(time.perf_counter() - start)
+        return percentiles(samples)
+
+    async def throughput(self, payload: bytes, concurrency: int, requests: int) -> Dict[str, float]:
+        """Débit de /analyze avec `concurrency` requêtes simultanées."""
+        pending = iter(range(requests))
+        latencies: List[float] = []
+
+        async def worker() -> None:
+            for _ in pending:
+                start = time.perf_counter()
+                await self.analyze(payload)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {"requests_per_second": requests / elapsed, **percentiles(latencies)}
+
+
+async def bench_endpoints(scenes: List[Scene], payloads: List[bytes], repeat: int,
+                          concurrency: List[int]) -> Tuple[Dict[str, Dict[str, Any]], Optional[float], Dict[str, Any]]:
+    """
+    Résultats par scène, pic de mémoire des workers et démarrage du service
+    (durées rapportées par /ready et latence de la première analyse).
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    service = ServiceBench()
+    startup: Dict[str, Any] = {}
+    async with service:
+        for scene, payload in zip(scenes, payloads):
+            result: Dict[str, Any] = {}
+            start = time.perf_counter()
+            data = await service.analyze(payload)
+            if not startup:
+                startup = {
+                    **{key: value for key, value in service.startup.items() if key.endswith("_ms")},
+                    "first_analyze_ms": (time.perf_counter() - start) * 1000,
+                }
+            marker = data.get("marker")
+            result["accuracy"] = accuracy(
+                scene, marker["corners"] if marker else None, data.get("pixels_per_mm"),
+                data["suggestions"], data["preliminary_measurements"]
+            )
+            result["/analyze"] = await service.timed(lambda: service.analyze(payload), repeat)
+
+            if marker:
+                warp = {"image_path": data["image_path"], "marker_corners": marker["corners"]}
+                result["/warp"] = await service.timed(lambda: service.warp(warp), repeat)
+                homography = {**warp, "mode": "homography"}
+                result["/warp homography"] = await service.timed(lambda: service.warp(homography), repeat)
+
+            result["throughput"] = {
+                str(level): await service.throughput(payload, level, max(repeat, 2 * level))
+                for level in concurrency
+            }
+            results[scene.config.name] = result
+    return results, service.worker_peak_rss_mb, startup
+
+
+def check(report: Dict[str, Any], baseline: Optional[Dict[str, Any]], args: argparse.Namespace) -> List[str]:
+    """Liste des régressions (vitesse ou précision)."""
+    failures = []
+    for scene_name, scene in report["scenes"].items():
+        for section in ("stages", "endpoints"):
+            accuracy_result = scene.get(section, {}).get("accuracy")
+            if accuracy_result is None:
+                continue
+            label = f"{scene_name} [{section}]"
+            if not accuracy_result["detected"]:
+                failures.append(f"{label}: feuille A4 non détectée")
+                continue
+            if accuracy_result["corner_error_mm"] > args.max_corner_error_mm:
+                failures.append(f"{label}: erreur des coins {accuracy_result['corner_error_mm']:.2f} mm")
+            if accuracy_result["length_error_pct"] > args.max_length_error_pct:
+                failures.append(f"{label}: erreur de longueur {accuracy_result['length_error_pct']:.2f} %")
+            if accuracy_result["area_error_pct"] > 2 * args.max_length_error_pct:
+                failures.append(f"{label}: erreur de surface {accuracy_result['area_error_pct']:.2f} %")
+            if accuracy_result.get("scale_vs_full_pct", 0.0) > args.max_scale_drift_pct:
+                failures.append(
+                    f"{label}: pixels_per_mm à {accuracy_result['scale_vs_full_pct']:.3f} % "
+                    f"de la détection pleine résolution"
+                )
+            if "object_suggested" not in accuracy_result:
+                continue
+            if not accuracy_result["object_suggested"]:
+                failures.append(
+                    f"{label}: objet absent des suggestions (IoU {accuracy_result['object_iou']:.2f})"
+                )
+            elif accuracy_result["object_area_error_pct"] > args.max_suggestion_area_error_pct:
+                failures.append(
+                    f"{label}: surface de l'objet suggéré à {accuracy_result['object_area_error_pct']:.2f} %"
+                )
+
+        if baseline is None or scene_name not in baseline.get("scenes", {}):
+            continue
+        reference = baseline["scenes"][scene_name]
+        for section in ("stages", "endpoints"):
+            for name, timing in scene.get(section, {}).items():
+                previous = reference.get(section, {}).get(name)
+                if not isinstance(timing, dict) or "p50" not in timing or not previous:
+                    continue
+                limit = previous["p50"] * (1 + args.max_slowdown)
+                if timing["p50"] > limit:
+                    failures.append(
+                        f"{scene_name} {name}: p50 {timing['p50']:.1f} ms > {limit:.1f} ms "
+                        f"(référence {previous['p50']:.1f} ms)"
+                    )
+
+    # Démarrage : préchauffage et première analyse (même première scène)
+    previous_startup = (baseline or {}).get("startup", {})
+    first_scene = next(iter(report["scenes"]), None)
+    same_scene = first_scene == next(iter((baseline or {}).get("scenes", {})), None)
+    for name, value in report.get("startup", {}).items():
+        previous = previous_startup.get(name)
+        if name not in ("warmup_ms", "first_analyze_ms") or not previous:
+            continue
+        if name == "first_analyze_ms" and not same_scene:
+            continue
+        limit = previous * (1 + args.max_slowdown)
+        if value > limit:
+            failures.append(f"démarrage {name}: {value:.1f} ms > {limit:.1f} ms (référence {previous:.1f} ms)")
+    return failures
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    for scene_name, scene in report["scenes"].items():
+        print(f"\n== {scene_name} ({scene['resolution']}) ==")
+        for section in ("stages", "endpoints"):
+            for name, value in scene.get(section, {}).items():
+                if name == "accuracy":
+                    if value["detected"]:
+                        print(f"  {section} précision   coins {value['corner_error_mm']:.3f} mm "
+                              f"({value['corner_error_px']:.2f} px), longueur {value['length_error_pct']:.3f} %, "
+                              f"surface {value['area_error_pct']:.3f} %")
+                        if value.get("object_suggested"):
+                            print(f"  {section} suggestion  objet trouvé (IoU {value['object_iou']:.2f}), "
+                                  f"surface {value['object_area_error_pct']:.3f} %")
+                        elif "object_suggested" in value:
+                            print(f"  {section} suggestion  objet absent (IoU {value['object_iou']:.2f})")
+                        if "scale_vs_full_pct" in value:
+                            print(f"  {section} échelle     {value['scale_vs_full_pct']:.3f} % "
+                                  f"de la détection pleine résolution")
+                    else:
+                        print(f"  {section} précision   feuille non détectée")
+                elif name == "throughput":
+                    for level, stats in value.items():
+                        print(f"  /analyze x{level:<3}        {stats['requests_per_second']:.2f} req/s, "
+                              f"p50 {stats['p50']:.1f} ms, p99 {stats['p99']:.1f} ms")
+                else:
+                    print(f"  {name:<22} p50 {value['p50']:8.1f} ms  p90 {value['p90']:8.1f} ms  "
+                          f"p99 {value['p99']:8.1f} ms")
+    startup = report.get("startup")
+    if startup:
+        # import_ms et total_ms incluent ici les mesures par étape, exécutées avant le démarrage
+        print(f"\nDémarrage : préchauffage {startup['warmup_ms']:.0f} ms, "
+              f"première analyse {startup['first_analyze_ms']:.0f} ms")
+    rss = report["peak_rss_mb"]
+    if rss["service"] is not None:
+        workers = f", worker {rss['worker']:.0f} Mo" if rss["worker"] is not None else ""
+        print(f"\nPic RSS : service {rss['service']:.0f} Mo{workers}")
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Banc d'essai du service IA de mesure")
+    parser.add_argument("--quick", action="store_true", help="Scènes 2 et 12 Mpx uniquement, moins de répétitions")
+    parser.add_argument("--scenes", help="Noms des scènes à exécuter, séparés par des virgules")
+    parser.add_argument("--repeat", type=int, default=None, help="Répétitions par mesure (défaut 5, 2 en --quick)")
+    parser.add_argument("--concurrency", default="1,2,4", help="Niveaux de concurrence pour /analyze")
+    parser.add_argument("--skip-endpoints", action="store_true", help="Ne mesurer que les étapes")
+    parser.add_argument("--baseline", type=Path, help="Rapport de référence pour détecter les régressions")
+    parser.add_argument("--save-baseline", type=Path, help="Enregistrer ce rapport comme référence")
+    parser.add_argument("--json", type=Path, help="Écrire le rapport complet en JSON")
+    parser.add_argument("--max-slowdown", type=float, default=0.25,
+                        help="Ralentissement maximal du p50 par rapport à la référence (0.25 = +25 %%)")
+    parser.add_argument("--max-corner-error-mm", type=float, default=1.0)
+    parser.add_argument("--max-length-error-pct", type=float, default=1.0)
+    parser.add_argument("--max-scale-drift-pct", type=float, default=0.2,
+                        help="Écart maximal de pixels_per_mm à une détection pleine résolution")
+    parser.add_argument("--max-suggestion-area-error-pct", type=float, default=3.0,
+                        help="Erreur maximale de la surface mesurée sur la suggestion de l'objet")
+    args = parser.parse_args(argv)
+
+    configs = QUICK_SCENES if args.quick else SCENES
+    if args.scenes:
+        wanted = set(args.scenes.split(","))
+        configs = [config for config in SCENES if config.name in wanted]
+    repeat = args.repeat or (2 if args.quick else 5)
+    concurrency = [int(level) for level in args.concurrency.split(",") if level]
+
+    report: Dict[str, Any] = {
+        "processor_version": main.PROCESSOR_VERSION,
+        "execution_mode": main.executor.mode,
+        "workers": main.executor.workers,
+        "repeat": repeat,
+        "scenes": {},
+    }
+    scenes, payloads = [], []
+    worker_rss = None
+    with tempfile.TemporaryDirectory(prefix="menui-bench-") as tmp:
+        for config in configs:
+            scene = render_scene(config)
+            ok, encoded = cv2.imencode(".jpg", scene.image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+            payload = encoded.tobytes()
+            image_path = Path(tmp) / f"{config.name}.jpg"
+            image_path.write_bytes(payload)
+
+            height, width = scene.image.shape[:2]
+            print(f"{config.name}: {width}x{height}", file=sys.stderr)
+            report["scenes"][config.name] = {
+                "resolution": f"{width}x{height}",
+                "stages": bench_stages(scene, image_path, repeat),
+            }
+            scenes.append(scene._replace(image=None))
+            payloads.append(payload)
+
+        if not args.skip_endpoints:
+            endpoints, worker_rss, startup = asyncio.run(bench_endpoints(scenes, payloads, repeat, concurrency))
+            for name, result in endpoints.items():
+                report["scenes"][name]["endpoints"] = result
+            report["startup"] = startup
+
+    report["peak_rss_mb"] = {"service": peak_rss_mb(), "worker": worker_rss}
+    print_report(report)
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(report, indent=2))
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    failures = check(report, baseline, args)
+    if failures:
+        print("\nRégressions :", file=sys.stderr)
+        for failure in failures:
+            print(f"  - {failure}", file=sys.stderr)
+        return 1
+    print("\nAucune régression.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,224 @@
+"""
+Caches du service : résultats d'analyse sur disque, images décodées en mémoire.
+
+Le cache de résultats est adressé par le contenu : la clé combine l'empreinte SHA-256 de l'image, les paramètres d'analyse et
+la version du processeur : une image identique renvoyée (retry du job,
+retraitement forcé) retrouve la réponse sans être décodée à nouveau.
+Les entrées sont de petits fichiers JSON, évincés par âge puis par taille
+totale (les moins récemment utilisés d'abord).
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional
+
+
+class ResultCache:
+    """
+    Cache JSON sur disque : `<directory>/<version>/<clé[:2]>/<clé>.json`.
+    Changer de version invalide tout le cache (les anciens répertoires
+    de version sont supprimés au démarrage).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        version: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age_seconds: float = 7 * 24 * 3600,
+        enabled: bool = True,
+        evict_every: int = 100,
+    ):
+        self.root = Path(directory)
+        self.version = version
+        self.directory = self.root / version
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self.evict_every = max(1, evict_every)
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, default_directory: Path, version: str) -> "ResultCache":
+        """Construire le cache à partir des variables d'environnement AI_CACHE_*."""
+        return cls(
+            directory=Path(os.getenv("AI_CACHE_DIR", str(default_directory))),
+            version=version,
+            max_bytes=int(float(os.getenv("AI_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            max_age_seconds=float(os.getenv("AI_CACHE_MAX_AGE_HOURS", "168")) * 3600,
+            enabled=os.getenv("AI_CACHE_ENABLED", "1").lower() not in ("0", "false", "no"),
+        )
+
+    def key(self, content_digest: str, params: Dict[str, Any]) -> str:
+        """Clé de cache pour une image (empreinte SHA-256) et des paramètres donnés."""
+        payload = json.dumps(
+            {"content": content_digest, "params": params, "version": self.version},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def setup(self) -> None:
+        """Créer le répertoire et supprimer les entrées des autres versions."""
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for entry in self.root.iterdir():
+            if entry.is_dir() and entry.name != self.version:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lire une entrée, ou None si absente, expirée ou illisible."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Marquer l'entrée comme récemment utilisée pour l'éviction LRU
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """Écrire une entrée de façon atomique (bloquant : à appeler hors de la boucle d'événements)."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+        # Compteur partagé par les threads qui écrivent dans le cache
+        with self._lock:
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= self.evict_every
+            if due:
+                self._puts_since_evict = 0
+        if due:
+            self.evict()
+
+    def invalidate(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def usage(self) -> Dict[str, Any]:
+        """Nombre d'entrées et taille totale du cache (version courante)."""
+        entries, size = 0, 0
+        if self.enabled and self.directory.exists():
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        size += entry.stat().st_size
+                    except OSError:
+                        continue
+                    entries += 1
+        return {"enabled": self.enabled, "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    def evict(self) -> int:
+        """
+        Supprimer les entrées expirées, puis les moins récemment utilisées
+        tant que la taille totale dépasse `max_bytes`.
+        Retourne le nombre d'entrées supprimées.
+        """
+        if not self.enabled or not self.directory.exists():
+            return 0
+
+        now = time.time()
+        removed = 0
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.max_age_seconds:
+                    Path(entry.path).unlink(missing_ok=True)
+                    removed += 1
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                Path(path).unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+        return removed
+
+
+class DecodedImageCache:
+    """
+    Cache mémoire LRU des images décodées, borné en octets.
+
+    Évite de décoder deux fois la même photo entre /analyze et /warp.
+    Chaque processus du pool a son propre cache : en mode `process`, un hit
+    suppose que les deux requêtes soient traitées par le même worker, et le
+    budget total est réparti entre les workers, avec un plancher (voir
+    `from_env`).
+    Les tableaux stockés sont en lecture seule, ne jamais les modifier.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, processes: int = 1, min_bytes: int = 0) -> "DecodedImageCache":
+        """
+        AI_DECODED_CACHE_MB est le budget de tout le service : chacun des
+        `processes` processus qui tiennent un cache en reçoit une part égale,
+        mais au moins `min_bytes` (une part plus petite que l'image la plus
+        grande ne servirait à rien). `0` désactive le cache.
+        """
+        total = float(os.getenv("AI_DECODED_CACHE_MB", "256")) * 1024 * 1024
+        if total <= 0:
+            return cls(max_bytes=0)
+        return cls(max_bytes=int(max(total / max(1, processes), min_bytes)))
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, key: Hashable, image: Any) -> None:
+        if image.nbytes > self.max_bytes:
+            return
+        image.flags.writeable = False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
@@ -0,0 +1,216 @@
+"""
+Exécution des traitements OpenCV hors de la boucle d'événements.
+
+Les fonctions d'analyse sont CPU-bound : les exécuter directement dans un
+endpoint `async def` bloque tout le worker uvicorn (uploads, /health...).
+`AnalysisExecutor` les délègue à un pool de processus (ou de threads) avec
+une profondeur de file bornée et un refus immédiat lorsque le pool est saturé.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+EXECUTION_MODES = ("process", "thread", "inline")
+
+
+class PoolSaturatedError(Exception):
+    """Levée lorsque le pool et sa file d'attente sont pleins."""
+
+    def __init__(self, in_flight: int, capacity: int):
+        super().__init__(f"Pool d'analyse saturé ({in_flight}/{capacity})")
+        self.in_flight = in_flight
+        self.capacity = capacity
+
+
+# Rapport de préchauffage du processus courant (worker du pool)
+_warmup_report: Optional[Dict[str, Any]] = None
+
+
+def _run_warmup(warmup: Callable[[], Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    report: Dict[str, Any] = {"pid": os.getpid(), "result": None, "error": None}
+    try:
+        report["result"] = warmup()
+    except Exception as e:
+        # Un préchauffage en échec ne doit pas empêcher le worker de servir
+        report["error"] = f"{type(e).__name__}: {e}"
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _init_worker(cv_threads: int, warmup: Optional[Callable[[], Any]] = None) -> None:
+    """
+    Initialiser un worker du pool : limiter le nombre de threads OpenCV
+    pour que N processus ne se disputent pas les mêmes cœurs, puis
+    exécuter `warmup` avant que le worker n'accepte des traitements.
+    """
+    global _warmup_report
+    import cv2
+
+    cv2.setNumThreads(cv_threads)
+    if warmup is not None:
+        _warmup_report = _run_warmup(warmup)
+
+
+def _worker_warmup_report(delay: float) -> Optional[Dict[str, Any]]:
+    # Occuper brièvement le worker pour que les appels se répartissent sur tous
+    time.sleep(delay)
+    return _warmup_report
+
+
+class AnalysisExecutor:
+    """
+    Pool d'exécution borné pour le pipeline d'analyse.
+
+    - `process` : ProcessPoolExecutor, un cœur par worker (production).
+    - `thread` : ThreadPoolExecutor, OpenCV relâche le GIL pendant ses calculs.
+    - `inline` : exécution directe dans la boucle (comportement historique).
+
+    Au-delà de `workers + max_queue` traitements en cours, `run()` lève
+    `PoolSaturatedError` au lieu de mettre la requête en attente.
+
+    `warmup` est exécuté une fois par worker, à son démarrage (y compris
+    ceux recréés après un crash) : voir `warm_up()`.
+    """
+
+    def __init__(
+        self,
+        mode: str = "process",
+        workers: Optional[int] = None,
+        max_queue: int = 4,
+        cv_threads: int = 1,
+        start_method: str = "spawn",
+        warmup: Optional[Callable[[], Any]] = None,
+    ):
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Mode d'exécution inconnu: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_queue = max(0, max_queue)
+        self.cv_threads = cv_threads
+        self.start_method = start_method
+        self.warmup = warmup
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+
+    @classmethod
+    def from_env(cls) -> "AnalysisExecutor":
+        """Construire l'exécuteur à partir des variables d'environnement AI_*."""
+        workers = os.getenv("AI_POOL_WORKERS")
+        return cls(
+            mode=os.getenv("AI_EXECUTION_MODE", "process"),
+            workers=int(workers) if workers else None,
+            max_queue=int(os.getenv("AI_POOL_MAX_QUEUE", "4")),
+            cv_threads=int(os.getenv("AI_CV_THREADS", "1")),
+            start_method=os.getenv("AI_POOL_START_METHOD", "spawn"),
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Nombre maximal de traitements acceptés simultanément."""
+        if self.mode == "inline":
+            return 1 + self.max_queue
+        return self.workers + self.max_queue
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Traitements acceptés mais pas encore pris en charge par un worker."""
+        active = 1 if self.mode == "inline" else self.workers
+        return max(0, self._in_flight - active)
+
+    @property
+    def saturated(self) -> bool:
+        return self._in_flight >= self.capacity
+
+    def start(self) -> None:
+        if self._pool is not None or self.mode == "inline":
+            _init_worker(self.cv_threads)
+            return
+        if self.mode == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(self.cv_threads, self.warmup),
+            )
+        else:
+            _init_worker(self.cv_threads)
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="analysis",
+            )
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def warm_up(self, timeout: float = 120.0) -> List[Dict[str, Any]]:
+        """
+        Démarrer et préchauffer tous les workers, et retourner leurs rapports
+        (`pid`, `seconds`, `result`, `error`).
+
+        Un ProcessPoolExecutor ne lance ses processus qu'à la demande : sans
+        cela, la première requête paierait le démarrage d'un processus en plus
+        du préchauffage. En mode `thread` ou `inline`, `warmup` est exécuté
+        une fois dans le processus du service.
+        """
+        if self.warmup is None:
+            return []
+        if self.mode != "process":
+            return [await asyncio.to_thread(_run_warmup, self.warmup)]
+
+        if self._pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        reports: Dict[int, Dict[str, Any]] = {}
+        deadline = loop.time() + timeout
+        # Autant d'appels que de workers lance tous les processus ; on recommence
+        # tant qu'un worker encore en préchauffage n'a pas répondu
+        while len(reports) < self.workers and loop.time() < deadline:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self._pool, _worker_warmup_report, 0.05)
+                for _ in range(self.workers)
+            ))
+            for report in results:
+                if report is not None:
+                    reports[report["pid"]] = report
+        return list(reports.values())
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Exécuter `fn(*args)` dans le pool et attendre le résultat.
+        Lève `PoolSaturatedError` si la capacité est atteinte.
+        """
+        if self.saturated:
+            raise PoolSaturatedError(self._in_flight, self.capacity)
+
+        self._in_flight += 1
+        try:
+            if self.mode == "inline":
+                return fn(*args)
+            if self._pool is None:
+                self.start()
+            pool = self._pool
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # Un worker est mort (OOM, segfault OpenCV) : recréer le pool
+                # pour les requêtes suivantes, une seule fois même si plusieurs
+                # requêtes en cours échouent avec lui.
+                if self._pool is pool:
+                    self._pool = None
+                    pool.shutdown(wait=False)
+                    self.start()
+                raise
+        finally:
+            self._in_flight -= 1
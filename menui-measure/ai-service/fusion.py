@@ -0,0 +1,238 @@
+"""
+Fusion des mesures de plusieurs photos d'une même surface.
+
+Chaque photo est analysée séparément, puis ses mesures sont ramenées sur le
+plan de la feuille A4 par l'homographie de son marqueur. La feuille restant
+en place entre les prises, ce plan est commun à toutes les photos : une même
+zone y occupe la même position, ce qui suffit à apparier les mesures d'une
+photo à l'autre. Le repère du plan partant du coin haut-gauche de l'image,
+la feuille d'une photo prise de l'autre côté de la surface (ou l'appareil
+tourné) y apparaît retournée : l'orientation retenue pour chaque photo est
+celle, parmi les deux que permet le format A4, qui place le mieux ses
+mesures sur celles des photos déjà traitées (`alignment_cost`).
+
+Les photos dont les mesures s'écartent nettement des autres (feuille mal
+détectée, photo floue...) sont écartées, puis chaque mesure est estimée par
+la moyenne des photos restantes. L'intervalle de confiance à 95 % vient de
+la dispersion entre photos (loi de Student), sans descendre sous
+l'incertitude propagée depuis les coins du marqueur.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Quantiles t(0,975) de la loi de Student, pour 1 à 30 degrés de liberté
+_T975 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+
+# Appariement : distance des centres au plus MATCH_TOLERANCE fois la taille
+# de la zone, tailles dans un rapport d'au plus 2
+MATCH_TOLERANCE = 0.25
+MATCH_MIN_SIZE_RATIO = 0.5
+
+# Score z robuste au-delà duquel une photo ou une valeur est écartée
+OUTLIER_Z = 3.5
+
+
+def student_t975(degrees_of_freedom: int) -> float:
+    if degrees_of_freedom <= 0:
+        return float("inf")
+    if degrees_of_freedom <= len(_T975):
+        return _T975[degrees_of_freedom - 1]
+    return 1.96
+
+
+@dataclass
+class FrameMeasure:
+    """Une mesure d'une photo, exprimée sur le plan de la feuille (mm)."""
+
+    frame: int
+    type: str  # "length" (mm) ou "area" (mm²)
+    value: float
+    uncertainty: float  # écart-type propagé depuis les coins du marqueur
+    confidence: float
+    plane_points: np.ndarray  # (N, 2) en mm
+
+    @property
+    def centroid(self) -> np.ndarray:
+        return self.plane_points.mean(axis=0)
+
+    @property
+    def size(self) -> float:
+        """Taille caractéristique en mm, pour l'appariement."""
+        return float(np.sqrt(self.value)) if self.type == "area" else self.value
+
+
+def match_measures(measures: Sequence[FrameMeasure]) -> List[List[int]]:
+    """
+    Regrouper les mesures qui désignent la même zone : au plus une par
+    photo, en partant des mesures les plus confiantes. Retourne les indices
+    de chaque groupe, la mesure de départ en premier.
+    """
+    if not measures:
+        return []
+    centroids = np.array([m.centroid for m in measures])
+    sizes = np.array([m.size for m in measures])
+    frames = np.array([m.frame for m in measures])
+    types = np.array([m.type for m in measures])
+
+    # Compatibilité de toutes les paires en un calcul
+    distance = np.linalg.norm(centroids[:, None] - centroids[None], axis=2)
+    larger = np.maximum(sizes[:, None], sizes[None])
+    smaller = np.minimum(sizes[:, None], sizes[None])
+    compatible = (
+        (distance <= MATCH_TOLERANCE * larger)
+        & (smaller >= MATCH_MIN_SIZE_RATIO * larger)
+        & (types[:, None] == types[None])
+        & (frames[:, None] != frames[None])
+    )
+
+    assigned = np.zeros(len(measures), dtype=bool)
+    groups = []
+    order = np.argsort([-m.confidence for m in measures], kind="stable")
+    for seed in order:
+        if assigned[seed]:
+            continue
+        members = [int(seed)]
+        assigned[seed] = True
+        candidates = np.flatnonzero(compatible[seed] & ~assigned)
+        for frame in np.unique(frames[candidates]):
+            in_frame = candidates[frames[candidates] == frame]
+            best = in_frame[np.argmin(distance[seed, in_frame])]
+            members.append(int(best))
+            assigned[best] = True
+        groups.append(members)
+    return groups
+
+
+def alignment_cost(candidate: Sequence[FrameMeasure], aligned: Sequence[FrameMeasure]) -> float:
+    """
+    Coût de placement des mesures d'une photo face aux mesures déjà placées :
+    pour chacune, distance au centre compatible le plus proche (même type,
+    tailles comparables) rapportée à la taille de la zone, plafonnée à 1
+    pour une mesure sans correspondant. Sert à choisir l'orientation de la
+    feuille (0° ou 180°) d'une photo.
+    """
+    if not candidate or not aligned:
+        return 0.0
+    centroids = np.array([m.centroid for m in candidate])
+    others = np.array([m.centroid for m in aligned])
+    sizes = np.array([m.size for m in candidate])
+    other_sizes = np.array([m.size for m in aligned])
+    types = np.array([m.type for m in candidate])
+    other_types = np.array([m.type for m in aligned])
+
+    distance = np.linalg.norm(centroids[:, None] - others[None], axis=2)
+    larger = np.maximum(sizes[:, None], other_sizes[None])
+    smaller = np.minimum(sizes[:, None], other_sizes[None])
+    compatible = (types[:, None] == other_types[None]) & (smaller >= MATCH_MIN_SIZE_RATIO * larger)
+    relative = np.where(compatible, distance / np.maximum(larger, 1e-9), 1.0)
+    return float(np.minimum(relative.min(axis=1), 1.0).sum())
+
+
+def robust_z(values: np.ndarray, floor: float) -> np.ndarray:
+    """
+    Écart à la médiane en unités de MAD normalisé (≈ écart-type), la
+    dispersion ne descendant pas sous `floor`.
+    """
+    median = np.median(values)
+    mad = 1.4826 * np.median(np.abs(values - median))
+    return np.abs(values - median) / max(mad, floor, 1e-9)
+
+
+def frame_outlier_scores(measures: Sequence[FrameMeasure], groups: List[List[int]],
+                         frame_count: int) -> np.ndarray:
+    """
+    Score de chaque photo : médiane de ses scores z dans les groupes vus
+    par au moins trois photos (NaN si la photo n'en a aucun).
+    """
+    per_frame: List[List[float]] = [[] for _ in range(frame_count)]
+    for members in groups:
+        if len(members) < 3:
+            continue
+        values = np.array([measures[i].value for i in members])
+        floor = float(np.median([measures[i].uncertainty for i in members]))
+        for index, z in zip(members, robust_z(values, floor)):
+            per_frame[measures[index].frame].append(float(z))
+    return np.array([np.median(scores) if scores else np.nan for scores in per_frame])
+
+
+def fuse_group(measures: Sequence[FrameMeasure], members: List[int],
+               frames_used: int) -> Optional[Dict[str, Any]]:
+    """
+    Estimation fusionnée d'un groupe (None s'il reste moins de deux photos) :
+    moyenne, écart-type entre photos, erreur standard, intervalle à 95 %.
+    Les valeurs isolées (score z > OUTLIER_Z) sont écartées si le groupe
+    compte au moins trois photos.
+    """
+    values = np.array([measures[i].value for i in members])
+    uncertainties = np.array([measures[i].uncertainty for i in members])
+    keep = np.ones(len(members), dtype=bool)
+    if len(members) >= 3:
+        keep = robust_z(values, float(np.median(uncertainties))) <= OUTLIER_Z
+    if keep.sum() < 2:
+        return None
+
+    kept, kept_uncertainties = values[keep], np.maximum(uncertainties[keep], 1e-9)
+    count = len(kept)
+    mean = float(kept.mean())
+    std = float(kept.std(ddof=1))
+    # Ne pas annoncer mieux que l'incertitude propagée depuis les coins
+    propagated = float(np.sqrt(1.0 / np.sum(1.0 / kept_uncertainties ** 2)))
+    standard_error = max(std / np.sqrt(count), propagated)
+    half_width = student_t975(count - 1) * standard_error
+
+    # Représentant : la mesure la plus proche de la moyenne
+    kept_members = [index for index, k in zip(members, keep) if k]
+    representative = kept_members[int(np.argmin(np.abs(kept - mean)))]
+
+    relative = half_width / abs(mean) if mean else float("inf")
+    return {
+        "type": measures[members[0]].type,
+        "value": mean,
+        "std": std,
+        "standard_error": standard_error,
+        "ci95": [mean - half_width, mean + half_width],
+        "frames": sorted(measures[i].frame for i in kept_members),
+        "rejected_frames": sorted(measures[i].frame for i, k in zip(members, keep) if not k),
+        # Part des photos retenues où la zone est vue, pondérée par la précision relative
+        "confidence": float(count / frames_used * max(0.0, 1.0 - relative)),
+        "plane_points": measures[representative].plane_points,
+    }
+
+
+def fuse_measures(measures: Sequence[FrameMeasure], frame_count: int) -> Dict[str, Any]:
+    """
+    Fusionner les mesures de `frame_count` photos (indices 0..frame_count-1,
+    chacune avec une feuille détectée).
+
+    Une photo est écartée si son score (voir `frame_outlier_scores`) dépasse
+    OUTLIER_Z ; il faut au moins trois photos, et la majorité est toujours
+    conservée. Retourne les mesures fusionnées (vues par au moins deux
+    photos, les mieux étayées d'abord), les photos écartées et les scores.
+    """
+    groups = match_measures(measures)
+    scores = frame_outlier_scores(measures, groups, frame_count)
+
+    outliers: List[int] = []
+    if frame_count >= 3:
+        flagged = [int(i) for i in np.flatnonzero(np.nan_to_num(scores) > OUTLIER_Z)]
+        if len(flagged) < frame_count / 2:
+            outliers = flagged
+
+    if outliers:
+        # Apparier à nouveau sans les photos écartées
+        measures = [m for m in measures if m.frame not in outliers]
+        groups = match_measures(measures)
+
+    frames_used = frame_count - len(outliers)
+    fused = [
+        result for result in (fuse_group(measures, members, frames_used) for members in groups)
+        if result is not None
+    ]
+    fused.sort(key=lambda result: (-len(result["frames"]), -result["confidence"]))
+    return {"measurements": fused, "outlier_frames": outliers, "scores": scores}
@@ -0,0 +1,198 @@
+"""
+Identification du format et des dimensions d'une image à partir de ses
+premiers octets, sans la décoder.
+
+Permet de refuser un upload (format non supporté, image démesurée) dès le
+premier bloc reçu, et de choisir une échelle de décodage réduite avant
+d'appeler OpenCV.
+"""
+import struct
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional, Tuple, Union
+
+import cv2
+
+# Formats décodables par OpenCV dans l'image Docker du service
+SUPPORTED_FORMATS = ("jpeg", "png", "webp", "bmp", "tiff")
+
+# Drapeaux imdecode par facteur de réduction (échelles de IMREAD_REDUCED_*)
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Marqueurs JPEG Start Of Frame portant les dimensions (hors DHT, JPG, DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                     0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Étiquettes TIFF ImageWidth / ImageLength, et format struct des types SHORT / LONG
+_TIFF_WIDTH, _TIFF_LENGTH = 256, 257
+_TIFF_TYPES = {3: "H", 4: "I"}
+
+# Entrées lues au plus dans un IFD TIFF (les dimensions sont parmi les premières)
+_TIFF_MAX_ENTRIES = 4096
+
+# Marques "ftyp" des conteneurs HEIF/HEIC (photos iPhone)
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1", b"avif"}
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: Optional[int] = None  # None si les dimensions ne sont pas dans les octets lus
+    height: Optional[int] = None
+
+    @property
+    def pixels(self) -> Optional[int]:
+        if self.width is None or self.height is None:
+            return None
+        return self.width * self.height
+
+
+def sniff_image_header(data: bytes) -> Optional[ImageHeader]:
+    """
+    Identifier le format (et si possible les dimensions) d'une image
+    à partir de ses premiers octets. Retourne None si le format est inconnu.
+    """
+    if data.startswith(b"\xff\xd8"):
+        return _sniff_jpeg(data)
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(data) >= 24 and data[12:16] == b"IHDR":
+            width, height = struct.unpack(">II", data[16:24])
+            return ImageHeader("png", width, height)
+        return ImageHeader("png")
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _sniff_webp(data)
+    if data.startswith(b"BM"):
+        if len(data) >= 26:
+            width, height = struct.unpack("<ii", data[18:26])
+            return ImageHeader("bmp", abs(width), abs(height))
+        return ImageHeader("bmp")
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return _sniff_tiff(data)
+    if data[4:8] == b"ftyp" and data[8:12] in _HEIF_BRANDS:
+        return ImageHeader("heic")
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return ImageHeader("gif")
+    return None
+
+
+def _sniff_jpeg(data: bytes) -> ImageHeader:
+    """Parcourir les segments JPEG jusqu'au marqueur SOF."""
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            break
+        marker = data[offset + 1]
+        if marker == 0xFF:  # octet de remplissage
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # marqueurs sans longueur
+            offset += 2
+            continue
+        if marker == 0xDA:  # début des données : plus d'en-tête après
+            break
+        (length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(data):
+                break
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return ImageHeader("jpeg", width, height)
+        offset += 2 + length
+    return ImageHeader("jpeg")
+
+
+def _tiff_layout(data: bytes) -> Tuple[str, int]:
+    """Ordre des octets (struct) et position du premier IFD d'un TIFF."""
+    order = "<" if data[:2] == b"II" else ">"
+    (offset,) = struct.unpack(order + "I", data[4:8])
+    return order, offset
+
+
+def _tiff_dimensions(order: str, ifd: bytes) -> Optional[Tuple[int, int]]:
+    """(largeur, hauteur) d'après un IFD TIFF (nombre d'entrées puis entrées)."""
+    if len(ifd) < 2:
+        return None
+    (count,) = struct.unpack(order + "H", ifd[:2])
+    values = {}
+    for start in range(2, min(2 + 12 * count, len(ifd) - 11), 12):
+        tag, kind, number = struct.unpack(order + "HHI", ifd[start:start + 8])
+        if tag in (_TIFF_WIDTH, _TIFF_LENGTH) and kind in _TIFF_TYPES and number == 1:
+            value_format = order + _TIFF_TYPES[kind]
+            (values[tag],) = struct.unpack(value_format, ifd[start + 8:start + 8 + struct.calcsize(value_format)])
+    if _TIFF_WIDTH not in values or _TIFF_LENGTH not in values:
+        return None
+    return values[_TIFF_WIDTH], values[_TIFF_LENGTH]
+
+
+def _sniff_tiff(data: bytes) -> ImageHeader:
+    """Dimensions du premier IFD, s'il est dans les octets lus."""
+    if len(data) < 8:
+        return ImageHeader("tiff")
+    order, offset = _tiff_layout(data)
+    dimensions = _tiff_dimensions(order, data[offset:]) if offset >= 8 else None
+    if dimensions is None:
+        return ImageHeader("tiff")
+    return ImageHeader("tiff", *dimensions)
+
+
+def _read_tiff_header(f: BinaryIO, head: bytes) -> ImageHeader:
+    """Lire le premier IFD d'un TIFF où qu'il soit dans le fichier (souvent à la fin)."""
+    if len(head) < 8:
+        return ImageHeader("tiff")
+    order, offset = _tiff_layout(head)
+    if offset < 8:
+        return ImageHeader("tiff")
+    f.seek(offset)
+    count = f.read(2)
+    if len(count) < 2:
+        return ImageHeader("tiff")
+    entries = min(struct.unpack(order + "H", count)[0], _TIFF_MAX_ENTRIES)
+    dimensions = _tiff_dimensions(order, count + f.read(12 * entries))
+    if dimensions is None:
+        return ImageHeader("tiff")
+    return ImageHeader("tiff", *dimensions)
+
+
+def read_image_header(path: Union[str, Path], max_bytes: int) -> Optional[ImageHeader]:
+    """
+    Comme sniff_image_header sur les `max_bytes` premiers octets d'un
+    fichier ; pour un TIFF, les dimensions sont lues dans le premier IFD
+    même s'il est plus loin.
+    """
+    with open(path, "rb") as f:
+        head = f.read(max_bytes)
+        header = sniff_image_header(head)
+        if header is not None and header.format == "tiff" and header.pixels is None:
+            header = _read_tiff_header(f, head)
+    return header
+
+
+def _sniff_webp(data: bytes) -> ImageHeader:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return ImageHeader("webp", width & 0x3FFF, height & 0x3FFF)
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return ImageHeader("webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return ImageHeader("webp", width, height)
+    return ImageHeader("webp")
+
+
+def reduced_decode_factor(header: Optional[ImageHeader], max_pixels: int) -> int:
+    """
+    Plus petit facteur de réduction au décodage (une clé de
+    REDUCED_DECODE_FLAGS) ramenant l'image sous `max_pixels`.
+    1 si les dimensions sont inconnues.
+    """
+    if header is None or header.pixels is None or max_pixels <= 0:
+        return 1
+    for factor in sorted(REDUCED_DECODE_FLAGS):
+        if header.pixels / (factor * factor) <= max_pixels:
+            return factor
+    return max(REDUCED_DECODE_FLAGS)
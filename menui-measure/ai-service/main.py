@@ -1,17 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+import time
+
+# Début de l'import du service (FastAPI, OpenCV, NumPy...), pour le temps de démarrage rapporté par /ready
+MODULE_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any, Tuple
 import cv2
 import numpy as np
+import asyncio
+import hashlib
+import heapq
 import json
+import mmap
 import os
+import tempfile
 import uuid
 from datetime import datetime
 import aiofiles
 from pathlib import Path
 
+from annotations import AnnotationRenderer
+from cache import DecodedImageCache, ResultCache
+from executor import AnalysisExecutor, PoolSaturatedError
+from fusion import FrameMeasure, alignment_cost, fuse_measures
+from imageinfo import (REDUCED_DECODE_FLAGS, SUPPORTED_FORMATS, ImageHeader, read_image_header,
+                       reduced_decode_factor, sniff_image_header)
+from metrics import Counter, MetricsRegistry, StageTimer
+from profiler import SamplingProfiler, collapsed, profiled_call
+from storage import ShardedDirectory, StorageManager
+
+# Version de l'algorithme d'analyse : la changer invalide le cache des résultats
+PROCESSOR_VERSION = "1.3.2"
+
 app = FastAPI(title="Service IA de Mesure Menui", version="1.0.0")
 
 # Configuration
@@ -20,16 +44,218 @@ if os.name == 'nt':  # Windows
     BASE_DIR = Path(__file__).parent
     UPLOAD_DIR = BASE_DIR / "uploads"
     PROCESSED_DIR = BASE_DIR / "processed"
+    CACHE_DIR = BASE_DIR / "cache"
 else:  # Docker/Linux
     UPLOAD_DIR = Path("/app/uploads")
     PROCESSED_DIR = Path("/app/processed")
+    CACHE_DIR = Path("/app/cache")
 
 UPLOAD_DIR.mkdir(exist_ok=True)
 PROCESSED_DIR.mkdir(exist_ok=True)
 
+# uploads/ et processed/ répartis par hachage du nom, nettoyés en tâche de fond
+# (voir storage.py) : AI_STORAGE_MAX_MB, AI_STORAGE_TTL_HOURS,
+# AI_STORAGE_GRACE_MINUTES, AI_STORAGE_GC_INTERVAL_MINUTES
+storage = StorageManager.from_env(UPLOAD_DIR, PROCESSED_DIR)
+
+# Images annotées rendues hors du chemin critique de /analyze (voir annotations.py)
+# AI_ANNOTATED_MODE=sync|background|lazy, AI_ANNOTATED_FORMAT=jpeg|webp,
+# AI_ANNOTATED_QUALITY, AI_ANNOTATED_MAX_SIDE, AI_ANNOTATED_THUMB_SIDE
+annotation_renderer = AnnotationRenderer.from_env(storage.processed)
+
+class ShardedStaticFiles(StaticFiles):
+    """
+    Fichiers servis sous leur seul nom (`/uploads/<nom>`) : cherchés dans
+    leur sous-répertoire de hachage, puis à plat (fichiers déjà présents
+    avant la répartition).
+    """
+    
+    def __init__(self, *, directory: Path, **kwargs):
+        super().__init__(directory=str(directory), **kwargs)
+        self.sharded = ShardedDirectory(directory)
+    
+    def lookup_path(self, path: str):
+        if "/" not in path and not path.startswith("."):
+            full_path, stat_result = super().lookup_path(self.sharded.relative(path))
+            if stat_result is not None:
+                return full_path, stat_result
+        return super().lookup_path(path)
+
+class LazyStaticFiles(ShardedStaticFiles):
+    """
+    Fichiers de processed/ : une image annotée pas encore rendue l'est au
+    premier GET de son URL. Les fichiers cachés (descriptions, fichiers
+    temporaires) ne sont jamais servis.
+    """
+    
+    async def get_response(self, path: str, scope):
+        if any(part.startswith(".") for part in Path(path).parts):
+            raise StarletteHTTPException(status_code=404)
+        
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as exc:
+            if exc.status_code != 404 or annotation_renderer.parse(path) is None:
+                raise
+        
+        try:
+            rendered = await render_annotation_once(path)
+        except PoolSaturatedError as exc:
+            raise pool_saturated_exception(exc)
+        if not rendered:
+            raise StarletteHTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
 # Monter les répertoires statiques
-app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
-app.mount("/processed", StaticFiles(directory=str(PROCESSED_DIR)), name="processed")
+app.mount("/uploads", ShardedStaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/processed", LazyStaticFiles(directory=PROCESSED_DIR), name="processed")
+
+# Pool d'exécution du pipeline OpenCV (voir executor.py)
+# AI_EXECUTION_MODE=process|thread|inline, AI_POOL_WORKERS, AI_POOL_MAX_QUEUE,
+# AI_CV_THREADS, AI_POOL_START_METHOD
+executor = AnalysisExecutor.from_env()
+
+# Cache des résultats d'analyse (voir cache.py)
+# AI_CACHE_DIR, AI_CACHE_MAX_MB, AI_CACHE_MAX_AGE_HOURS, AI_CACHE_ENABLED
+result_cache = ResultCache.from_env(CACHE_DIR, PROCESSOR_VERSION)
+
+# Racine du volume partagé avec Laravel pour l'analyse par chemin (désactivée si vide)
+SHARED_ROOT = Path(os.getenv("AI_SHARED_ROOT")).resolve() if os.getenv("AI_SHARED_ROOT") else None
+
+def counter_ratio(counter: Counter, label: str, success: str, failure: str) -> float:
+    """Part des `success` parmi `success` + `failure` pour un compteur à un label."""
+    good = counter.value(**{label: success})
+    total = good + counter.value(**{label: failure})
+    return good / total if total else 0.0
+
+# Métriques exposées par /metrics (voir metrics.py). Les étapes exécutées dans
+# le pool sont chronométrées dans le worker et enregistrées ici.
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    "menui_ai_stage_seconds", "Durée des étapes du pipeline", ["stage"]
+)
+REQUEST_SECONDS = metrics.histogram(
+    "menui_ai_request_seconds", "Durée des requêtes HTTP (jusqu'aux en-têtes de réponse)",
+    ["route", "method", "status"]
+)
+REQUESTS_IN_FLIGHT = metrics.gauge("menui_ai_requests_in_flight", "Requêtes HTTP en cours")
+metrics.gauge("menui_ai_pool_in_flight", "Traitements acceptés par le pool",
+              function=lambda: executor.in_flight)
+metrics.gauge("menui_ai_pool_queue_depth", "Traitements en attente d'un worker",
+              function=lambda: executor.queue_depth)
+metrics.gauge("menui_ai_pool_capacity", "Traitements acceptés au maximum par le pool",
+              function=lambda: executor.capacity)
+POOL_REJECTIONS = metrics.counter("menui_ai_pool_rejections_total", "Requêtes refusées car le pool était saturé")
+IMAGE_MEGAPIXELS = metrics.histogram(
+    "menui_ai_image_megapixels", "Taille des images analysées, en mégapixels",
+    buckets=(1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 100)
+)
+PROCESSED_MEGAPIXELS = metrics.counter("menui_ai_processed_megapixels_total", "Mégapixels analysés")
+CACHE_LOOKUPS = metrics.counter("menui_ai_cache_lookups_total", "Consultations du cache de résultats", ["result"])
+metrics.gauge("menui_ai_cache_hit_ratio", "Part des consultations du cache trouvées",
+              function=lambda: counter_ratio(CACHE_LOOKUPS, "result", "hit", "miss"))
+DETECTIONS = metrics.counter("menui_ai_detections_total", "Analyses par résultat de détection du marqueur", ["result"])
+metrics.gauge("menui_ai_detection_success_ratio", "Part des analyses où le marqueur A4 est détecté",
+              function=lambda: counter_ratio(DETECTIONS, "result", "success", "failure"))
+
+STORAGE_BYTES = metrics.gauge("menui_ai_storage_bytes", "Taille des fichiers stockés, au dernier nettoyage", ["area"])
+STORAGE_FILES = metrics.gauge("menui_ai_storage_files", "Nombre de fichiers stockés, au dernier nettoyage", ["area"])
+STORAGE_REAPED = metrics.counter(
+    "menui_ai_storage_reaped_groups_total", "Uploads (avec leurs artefacts) supprimés par le nettoyage", ["reason"]
+)
+STORAGE_GC_ERRORS = metrics.counter("menui_ai_storage_gc_errors_total", "Passes de nettoyage du stockage en échec")
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+TRACK_FRAMES = metrics.counter(
+    "menui_ai_track_frames_total",
+    "Images du suivi temps réel : suivies, recherchées en entier, ignorées ou invalides",
+    ["result"]
+)
+metrics.gauge("menui_ai_track_sessions", "Sessions de suivi temps réel ouvertes",
+              function=lambda: tracking_sessions)
+
+STARTUP_SECONDS = metrics.gauge(
+    "menui_ai_startup_seconds", "Durée du démarrage par phase (import, setup, warmup, total)", ["phase"]
+)
+metrics.gauge("menui_ai_ready", "1 une fois le préchauffage terminé",
+              function=lambda: float(startup_state["ready"]))
+
+# Préchauffage au démarrage (analyse synthétique dans chaque worker) et délai
+# maximal d'attente des workers avant d'ouvrir /ready
+WARMUP_ENABLED = os.getenv("AI_WARMUP_ENABLED", "1").lower() not in ("0", "false", "no")
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("AI_WARMUP_TIMEOUT_SECONDS", "120"))
+
+# Profileur par échantillonnage, activable à chaud par /debug/profile/* si
+# AI_PROFILING_ENABLED=1 (voir profiler.py)
+PROFILING_ENABLED = os.getenv("AI_PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+profiler = SamplingProfiler()
+
+# Nombre maximal d'images acceptées par /analyze/batch et /analyze/fusion
+BATCH_MAX_FILES = int(os.getenv("AI_BATCH_MAX_FILES", "20"))
+FUSION_MAX_FILES = int(os.getenv("AI_FUSION_MAX_FILES", "10"))
+
+# Taille des blocs lus lors de la copie des uploads sur disque
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Octets lus au maximum pour identifier le format et les dimensions d'une image
+SNIFF_MAX_BYTES = 512 * 1024
+
+# Limites d'ingestion : taille du fichier, pixels déclarés, pixels décodés
+# (au-delà de AI_MAX_DECODE_MEGAPIXELS, l'image est décodée à 1/2, 1/4 ou 1/8)
+MAX_UPLOAD_BYTES = int(float(os.getenv("AI_MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.getenv("AI_MAX_IMAGE_MEGAPIXELS", "100")) * 1_000_000)
+MAX_DECODE_PIXELS = int(float(os.getenv("AI_MAX_DECODE_MEGAPIXELS", "16")) * 1_000_000)
+
+# Images décodées partagées entre /analyze et /warp (par processus) ;
+# AI_DECODED_CACHE_MB est réparti entre les workers en mode `process`,
+# chacun gardant au moins la place d'une image décodée (BGR) de taille maximale
+decoded_cache = DecodedImageCache.from_env(
+    executor.workers if executor.mode == "process" else 1,
+    min_bytes=MAX_DECODE_PIXELS * 3
+)
+
+# Suggestions de mesures : côté max de l'image de travail, marge autour du
+# marqueur (en tailles de marqueur, 0 = image entière) et nombre de suggestions
+SUGGEST_MAX_SIDE = int(os.getenv("AI_SUGGEST_MAX_SIDE", "1600"))
+SUGGEST_ROI_MARGIN = float(os.getenv("AI_SUGGEST_ROI_MARGIN", "3"))
+SUGGEST_TOP_K = 5
+
+# Dimensions de la feuille A4 en mm
+A4_SHORT_MM = 210.0
+A4_LONG_MM = 297.0
+
+# Incertitude de localisation des coins du marqueur (pixels de l'image d'origine)
+# et nombre de tirages utilisés pour la propager aux mesures
+CORNER_SIGMA_PX = float(os.getenv("AI_CORNER_SIGMA_PX", "1.5"))
+MEASURE_SAMPLES = 32
+MEASURE_MAX_POINTS = 10_000
+
+# Limites du rendu /warp (résolution et taille de l'image redressée)
+WARP_MAX_DPI = 600
+WARP_MAX_PIXELS = int(float(os.getenv("AI_WARP_MAX_MEGAPIXELS", "40")) * 1_000_000)
+
+# Côté maximal de l'image réduite utilisée pour chercher le marqueur A4
+DETECT_MAX_SIDE = int(os.getenv("AI_DETECT_MAX_SIDE", "1024"))
+
+# Aires minimales (pixels² de l'image d'origine) de la feuille A4 et d'une
+# zone suggérée
+MARKER_MIN_AREA_PX = 10000.0
+SUGGEST_MIN_AREA_PX = 1000.0
+
+# Suivi temps réel du marqueur (/ws/track) : côté max des images traitées,
+# âge maximal d'une image avant d'être ignorée, sessions simultanées
+TRACK_MAX_SIDE = int(os.getenv("AI_TRACK_MAX_SIDE", "640"))
+TRACK_BUDGET_MS = float(os.getenv("AI_TRACK_BUDGET_MS", "150"))
+TRACK_MAX_SESSIONS = int(os.getenv("AI_TRACK_MAX_SESSIONS", "16"))
+TRACK_MAX_FRAME_BYTES = 1024 * 1024
+TRACK_MAX_FRAME_PIXELS = 4_000_000
+TRACK_STABLE_FRAMES = 3  # images correctes consécutives avant "good_to_capture"
+
+class InvalidImageError(ValueError):
+    """Le contenu envoyé ne peut pas être décodé par OpenCV."""
 
 class MarkerDetection(BaseModel):
     corners: List[List[float]]
@@ -47,17 +273,131 @@ class AnalyzeResponse(BaseModel):
     suggestions: List[MeasurementSuggestion]
     preliminary_measurements: List[Dict[str, Any]]
     annotated_image_url: str
+    annotated_thumbnail_url: Optional[str] = None
     success: bool
     message: str
+    image_path: Optional[str] = None
+    processor_version: str = PROCESSOR_VERSION
+    cache_hit: bool = False
+    timings: Optional[Dict[str, float]] = None  # durées des étapes en ms (?timings=true)
+
+class MeasureShape(BaseModel):
+    id: Optional[Any] = None  # renvoyé tel quel
+    type: str  # "length" (polyligne) ou "area" (polygone)
+    points: List[List[float]]
+
+class MeasureRequest(BaseModel):
+    marker_corners: List[List[float]]
+    shapes: List[MeasureShape]
+    corner_sigma_px: Optional[float] = Field(None, ge=0)  # pixels, défaut AI_CORNER_SIGMA_PX
+
+class ShapeMeasurement(BaseModel):
+    id: Optional[Any] = None
+    type: str
+    value_mm: Optional[float] = None
+    uncertainty_mm: Optional[float] = None
+    value_mm2: Optional[float] = None
+    value_m2: Optional[float] = None
+    uncertainty_mm2: Optional[float] = None
+
+class MeasureResponse(BaseModel):
+    measurements: List[ShapeMeasurement]
+    plane_size_mm: List[float]
+    homography_mm: List[List[float]]
+
+class BatchItemResult(BaseModel):
+    index: int
+    filename: Optional[str]
+    metadata: Optional[Dict[str, Any]]
+    status_code: int
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[str] = None
+
+class FusionFrame(BaseModel):
+    index: int  # position dans `files`
+    filename: Optional[str] = None
+    status: str  # "used", "no_marker", "outlier" ou "error"
+    error: Optional[str] = None
+    image_path: Optional[str] = None  # nom du fichier dans uploads/
+    annotated_image_url: Optional[str] = None
+    marker_corners: Optional[List[List[float]]] = None
+    pixels_per_mm: Optional[float] = None
+    homography_mm: Optional[List[List[float]]] = None  # image -> plan de la feuille (mm)
+    to_reference: Optional[List[List[float]]] = None  # image -> image de référence
+    outlier_score: Optional[float] = None  # score z robuste (au-delà de 3,5 : écartée)
+
+class FusedMeasurement(BaseModel):
+    id: int
+    type: str  # "length" ou "area"
+    value_mm: Optional[float] = None
+    value_mm2: Optional[float] = None
+    value_m2: Optional[float] = None
+    std: float  # écart-type entre photos, en mm ou mm²
+    standard_error: float
+    ci95: List[float]  # intervalle de confiance à 95 %, en mm ou mm²
+    confidence: float
+    frames: List[int]  # photos (index) ayant contribué
+    rejected_frames: List[int]  # photos dont la valeur a été écartée
+    plane_poly: List[List[float]]  # contour sur le plan de la feuille (mm)
+    reference_poly: List[List[float]]  # contour dans l'image de référence
+
+class FusionResponse(BaseModel):
+    success: bool
+    message: str
+    reference_frame: Optional[int] = None  # photo de référence (index)
+    frames_used: int
+    frames: List[FusionFrame]
+    measurements: List[FusedMeasurement]
+    processor_version: str = PROCESSOR_VERSION
 
 class WarpRequest(BaseModel):
-    image_path: str
+    image_path: Optional[str] = None  # nom du fichier dans uploads/
+    path: Optional[str] = None  # chemin relatif sur le volume partagé
     marker_corners: List[List[float]]
+    mode: str = "image"  # "image" (rendu JPEG) ou "homography" (matrice et points seulement)
+    dpi: float = 300.0
+    roi: Optional[List[float]] = None  # [x, y, largeur, hauteur] en mm sur le plan de la feuille
+    points: Optional[List[List[float]]] = None  # points de l'image à redresser
+    polygons: Optional[List[List[List[float]]]] = None  # polygones de l'image à redresser
 
-def detect_a4_marker(image: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
+def detect_a4_marker(image: np.ndarray, decode_factor: int = 1) -> Optional[Tuple[np.ndarray, float]]:
     """
     Détecter une feuille A4 dans l'image.
     Retourne les coins et le facteur pixels_per_mm.
+    `decode_factor` : réduction appliquée au décodage, pour exprimer l'aire
+    minimale de la feuille dans l'image d'origine.
+    
+    La recherche du quadrilatère se fait sur une version réduite de l'image
+    (côté max AI_DETECT_MAX_SIDE), puis les coins sont affinés en pleine
+    résolution par cornerSubPix dans de petites fenêtres autour de chaque coin.
+    Sur une feuille bien contrastée, les coins restent à ~1 px de ceux d'une
+    détection pleine résolution et pixels_per_mm à moins de 0,2 % près
+    (vérifié par benchmark.py, `--max-scale-drift-pct`).
+    """
+    height, width = image.shape[:2]
+    # Facteur de réduction entier : chemin rapide de INTER_AREA
+    factor = max(1, int(np.ceil(max(height, width) / DETECT_MAX_SIDE)))
+    if factor > 1:
+        coarse = cv2.resize(image, None, fx=1.0 / factor, fy=1.0 / factor,
+                            interpolation=cv2.INTER_AREA)
+    else:
+        coarse = image
+    
+    scale = factor * decode_factor
+    coarse_corners = find_a4_quad(coarse, min_area=MARKER_MIN_AREA_PX / (scale * scale))
+    if coarse_corners is None:
+        return None
+    
+    # Remonter en pleine résolution (centre des blocs factor x factor) puis affiner localement
+    corners = coarse_corners.astype(np.float32) * factor + (factor - 1) / 2.0
+    if factor > 1:
+        corners = refine_corners(image, corners, window=2 * factor + 4)
+    
+    return corners, compute_pixels_per_mm(corners)
+
+def find_a4_quad(image: np.ndarray, min_area: float) -> Optional[np.ndarray]:
+    """
+    Chercher le plus grand quadrilatère au ratio A4 parmi les contours de l'image.
     """
     # Convertir en niveaux de gris
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -70,15 +410,22 @@ def detect_a4_marker(image: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
     
     # Trouver les contours
     contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
     
-    # Filtrer et trier les contours par aire
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)
+    # Sélectionner les 10 plus grands contours sans trier toute la liste
+    areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=np.float64, count=len(contours))
+    top_k = min(10, len(contours))
+    candidates = np.argpartition(-areas, top_k - 1)[:top_k]
+    candidates = candidates[np.argsort(-areas[candidates])]
     
     # Ratio A4: 210/297 ≈ 0.707
     target_ratio = 210.0 / 297.0
     tolerance = 0.1  # 10% de tolérance
     
-    for contour in contours[:10]:  # Examiner les 10 plus grands contours
+    for idx in candidates:
+        contour = contours[idx]
+        
         # Approximer le contour à un polygone
         epsilon = 0.02 * cv2.arcLength(contour, True)
         approx = cv2.approxPolyDP(contour, epsilon, True)
@@ -87,12 +434,11 @@ def detect_a4_marker(image: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
         if len(approx) == 4:
             # Calculer l'aire
             area = cv2.contourArea(approx)
-            if area < 10000:  # Ignorer les petits contours
+            if area < min_area:  # Ignorer les petits contours
                 continue
             
             # Ordonner les coins
-            corners = approx.reshape(4, 2)
-            corners = order_corners(corners)
+            corners = order_corners(approx.reshape(4, 2))
             
             # Calculer les dimensions
             width = np.linalg.norm(corners[1] - corners[0])
@@ -102,20 +448,86 @@ def detect_a4_marker(image: np.ndarray) -> Optional[Tuple[np.ndarray, float]]:
             ratio = min(width, height) / max(width, height)
             
             if abs(ratio - target_ratio) < tolerance:
-                # Calculer pixels_per_mm
-                if width < height:  # Portrait
-                    pixels_per_mm_w = width / 210.0
-                    pixels_per_mm_h = height / 297.0
-                else:  # Paysage
-                    pixels_per_mm_w = width / 297.0
-                    pixels_per_mm_h = height / 210.0
-                
-                pixels_per_mm = (pixels_per_mm_w + pixels_per_mm_h) / 2.0
-                
-                return corners, pixels_per_mm
+                return corners
     
     return None
 
+def refine_corners(image: np.ndarray, corners: np.ndarray, window: int) -> np.ndarray:
+    """
+    Affiner les coins au sous-pixel en pleine résolution, uniquement dans
+    une fenêtre de ±window pixels autour de chaque coin.
+    Un coin qui s'éloigne de plus de `window` pixels garde sa position initiale.
+    """
+    height, width = image.shape[:2]
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    half_win = max(2, window // 2)
+    refined = corners.copy()
+    
+    for i, (x, y) in enumerate(corners):
+        x0 = max(0, int(x) - window)
+        y0 = max(0, int(y) - window)
+        x1 = min(width, int(x) + window + 1)
+        y1 = min(height, int(y) + window + 1)
+        if x1 - x0 <= 2 * half_win + 5 or y1 - y0 <= 2 * half_win + 5:
+            continue
+        
+        roi = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        point = np.array([[[x - x0, y - y0]]], dtype=np.float32)
+        cv2.cornerSubPix(roi, point, (half_win, half_win), (-1, -1), criteria)
+        
+        new_x, new_y = point[0, 0] + (x0, y0)
+        if abs(new_x - x) <= window and abs(new_y - y) <= window:
+            refined[i] = (new_x, new_y)
+    
+    return refined
+
+def edge_sharpness(gray: np.ndarray, corners: np.ndarray, samples: int = 16, reach: int = 6) -> float:
+    """
+    Netteté des bords de la feuille : pente maximale du profil d'intensité
+    perpendiculaire à chaque bord, rapportée au contraste de ce profil.
+    Vaut ~1 pour un bord franc et diminue avec le flou (~1 / largeur du flou).
+    """
+    starts = corners.astype(np.float32)
+    ends = np.roll(starts, -1, axis=0)
+    t = (np.arange(samples, dtype=np.float32) + 0.5) / samples
+    points = starts[:, None, :] + (ends - starts)[:, None, :] * t[None, :, None]
+    
+    direction = ends - starts
+    normals = np.stack([-direction[:, 1], direction[:, 0]], axis=1)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1, keepdims=True), 1e-6)
+    offsets = np.arange(-reach, reach + 1, dtype=np.float32)
+    
+    # Profils échantillonnés en un seul remap : (4 * samples) x (2 * reach + 1)
+    profiles = points[:, :, None, :] + normals[:, None, None, :] * offsets[None, None, :, None]
+    profiles = profiles.reshape(-1, len(offsets), 2)
+    values = cv2.remap(gray, profiles[..., 0], profiles[..., 1], cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_REPLICATE).astype(np.float32)
+    
+    contrast = values.max(axis=1) - values.min(axis=1)
+    steepest = np.abs(np.diff(values, axis=1)).max(axis=1)
+    valid = contrast > 20
+    if not valid.any():
+        return 0.0
+    return float(np.median(steepest[valid] / contrast[valid]))
+
+def compute_pixels_per_mm(corners: np.ndarray) -> float:
+    """
+    Facteur d'échelle moyen du marqueur (portrait ou paysage).
+    """
+    # Calculer les dimensions
+    width = np.linalg.norm(corners[1] - corners[0])
+    height = np.linalg.norm(corners[3] - corners[0])
+    
+    # Calculer pixels_per_mm
+    if width < height:  # Portrait
+        pixels_per_mm_w = width / 210.0
+        pixels_per_mm_h = height / 297.0
+    else:  # Paysage
+        pixels_per_mm_w = width / 297.0
+        pixels_per_mm_h = height / 210.0
+    
+    return float((pixels_per_mm_w + pixels_per_mm_h) / 2.0)
+
 def order_corners(corners: np.ndarray) -> np.ndarray:
     """
     Ordonner les coins dans l'ordre: haut-gauche, haut-droit, bas-droit, bas-gauche.
@@ -138,28 +550,164 @@ def order_corners(corners: np.ndarray) -> np.ndarray:
     
     return ordered
 
-def compute_homography(src_corners: np.ndarray, dst_size: Tuple[int, int]) -> np.ndarray:
+def a4_plane_size(corners: np.ndarray) -> Tuple[float, float]:
     """
-    Calculer la matrice d'homographie pour transformer l'image en vue de dessus.
+    Dimensions en mm (largeur, hauteur) de la feuille dans l'ordre des coins :
+    portrait si le bord haut est plus court que le bord gauche, paysage sinon.
     """
+    width = np.linalg.norm(corners[1] - corners[0])
+    height = np.linalg.norm(corners[3] - corners[0])
+    if width < height:
+        return A4_SHORT_MM, A4_LONG_MM
+    return A4_LONG_MM, A4_SHORT_MM
+
+def plane_homography(src_corners: np.ndarray) -> np.ndarray:
+    """
+    Homographie image -> plan de la feuille, en mm (origine au coin haut-gauche).
+    """
+    width_mm, height_mm = a4_plane_size(src_corners)
     dst_corners = np.array([
         [0, 0],
-        [dst_size[0] - 1, 0],
-        [dst_size[0] - 1, dst_size[1] - 1],
-        [0, dst_size[1] - 1]
+        [width_mm, 0],
+        [width_mm, height_mm],
+        [0, height_mm]
     ], dtype=np.float32)
+    return cv2.getPerspectiveTransform(src_corners.astype(np.float32), dst_corners)
+
+def valid_marker_quad(corners: np.ndarray) -> bool:
+    """
+    Les coins (dans l'ordre du contour) forment-ils un quadrilatère convexe
+    d'aire non nulle ? Sinon l'homographie du marqueur est dégénérée.
+    """
+    contour = corners.reshape(-1, 1, 2).astype(np.float32)
+    if not np.all(np.isfinite(contour)) or cv2.contourArea(contour) < 1.0:
+        return False
+    return bool(cv2.isContourConvex(contour))
+
+def transform_points(H: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Appliquer une homographie à un tableau (N, 2) de points en un seul appel."""
+    if len(points) == 0:
+        return points.reshape(0, 2)
+    return cv2.perspectiveTransform(points.reshape(-1, 1, 2).astype(np.float64), H).reshape(-1, 2)
+
+def measure_shapes(corners: np.ndarray, shapes: List[np.ndarray], types: List[str],
+                   corner_sigma_px: float = CORNER_SIGMA_PX) -> List[Dict[str, Any]]:
+    """
+    Mesurer en lot des polylignes ("length", en mm) et des polygones ("area",
+    en mm² et m²) tracés dans l'image, sur le plan de la feuille A4.
     
-    H, _ = cv2.findHomography(src_corners, dst_corners)
-    return H
+    Tous les points sont projetés par l'homographie du marqueur en une seule
+    opération NumPy, ce qui corrige la perspective (contrairement à un
+    pixels_per_mm moyen). L'incertitude est l'écart-type des mesures obtenues
+    en perturbant les coins de `corner_sigma_px` pixels (MEASURE_SAMPLES
+    tirages à graine fixe : le résultat est reproductible).
+    """
+    if not shapes:
+        return []
+    
+    counts = np.array([len(points) for points in shapes])
+    points = np.concatenate([np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in shapes])
+    shape_ids = np.repeat(np.arange(len(shapes)), counts)
+    
+    # Homographie nominale puis homographies aux coins perturbés
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0.0, corner_sigma_px, (MEASURE_SAMPLES, 4, 2))
+    corners = corners.astype(np.float64)
+    homographies = np.stack(
+        [plane_homography(corners)] + [plane_homography(corners + n) for n in noise]
+    )
+    
+    # Projection de tous les points pour toutes les homographies : (K+1, N, 2)
+    homogeneous = np.column_stack([points, np.ones(len(points))])
+    projected = homogeneous @ homographies.transpose(0, 2, 1)
+    plane = projected[..., :2] / projected[..., 2:3]
+    
+    # Point suivant dans la même forme, en rebouclant sur le premier
+    starts = np.cumsum(counts) - counts
+    ends = starts + counts - 1
+    following = np.arange(len(points)) + 1
+    following[ends] = starts
+    nxt = plane[:, following]
+    
+    # Longueur des polylignes : segments consécutifs, sans le segment de fermeture
+    segments = np.linalg.norm(nxt - plane, axis=2)
+    segments[:, ends] = 0.0
+    lengths = np.zeros((len(homographies), len(shapes)))
+    np.add.at(lengths.T, shape_ids, segments.T)
+    
+    # Aire des polygones : formule du lacet
+    cross = plane[..., 0] * nxt[..., 1] - nxt[..., 0] * plane[..., 1]
+    areas = np.zeros((len(homographies), len(shapes)))
+    np.add.at(areas.T, shape_ids, cross.T)
+    areas = np.abs(areas) / 2.0
+    
+    length_std = lengths[1:].std(axis=0, ddof=1)
+    area_std = areas[1:].std(axis=0, ddof=1)
+    
+    results = []
+    for i, shape_type in enumerate(types):
+        if shape_type == "area":
+            results.append({
+                "type": "area",
+                "value_mm2": float(areas[0, i]),
+                "value_m2": float(areas[0, i] / 1_000_000),
+                "uncertainty_mm2": float(area_std[i])
+            })
+        else:
+            results.append({
+                "type": "length",
+                "value_mm": float(lengths[0, i]),
+                "uncertainty_mm": float(length_std[i])
+            })
+    return results
 
-def suggest_measurements(image: np.ndarray, pixels_per_mm: float) -> List[MeasurementSuggestion]:
+def suggestion_region(image_shape: Tuple[int, ...],
+                      marker_corners: Optional[np.ndarray]) -> Tuple[int, int, int, int]:
     """
-    Suggérer des zones à mesurer dans l'image.
+    Zone (x0, y0, x1, y1) où chercher des objets : la boîte du marqueur
+    élargie de SUGGEST_ROI_MARGIN fois sa taille de chaque côté (les objets
+    mesurables sont sur le même plan, à une échelle comparable).
     """
-    suggestions = []
+    height, width = image_shape[:2]
+    if marker_corners is None or SUGGEST_ROI_MARGIN <= 0:
+        return 0, 0, width, height
+    
+    (min_x, min_y), (max_x, max_y) = marker_corners.min(axis=0), marker_corners.max(axis=0)
+    margin = SUGGEST_ROI_MARGIN * max(max_x - min_x, max_y - min_y)
+    return (
+        max(0, int(min_x - margin)),
+        max(0, int(min_y - margin)),
+        min(width, int(np.ceil(max_x + margin))),
+        min(height, int(np.ceil(max_y + margin)))
+    )
+
+def suggest_measurements(image: np.ndarray, pixels_per_mm: float,
+                         marker_corners: Optional[np.ndarray] = None,
+                         decode_factor: int = 1) -> List[MeasurementSuggestion]:
+    """
+    Suggérer des zones à mesurer dans l'image (réduite de `decode_factor`
+    au décodage).
+    
+    Le traitement est limité à la zone autour du marqueur, réduite à
+    SUGGEST_MAX_SIDE pixels de côté. Les composantes sont préfiltrées en
+    bloc sur leur boîte englobante (majorant de l'aire du contour) avant
+    tout calcul de contour, puis filtrées sur l'aire exacte de leur contour
+    externe ; seules les SUGGEST_TOP_K plus compactes sont conservées (tas
+    borné), approximées et converties en MeasurementSuggestion.
+    """
+    x0, y0, x1, y1 = suggestion_region(image.shape, marker_corners)
+    region = image[y0:y1, x0:x1]
+    
+    # Facteur de réduction entier : chemin rapide de INTER_AREA
+    factor = max(1, int(np.ceil(max(region.shape[:2]) / SUGGEST_MAX_SIDE)))
+    if factor > 1:
+        region = cv2.resize(region, None, fx=1.0 / factor, fy=1.0 / factor,
+                            interpolation=cv2.INTER_AREA)
+    # Ignorer les petits contours (aire exprimée dans l'image d'origine)
+    min_area = SUGGEST_MIN_AREA_PX / (factor * decode_factor) ** 2
     
     # Convertir en niveaux de gris
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
     
     # Appliquer un seuillage adaptatif
     thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
@@ -170,83 +718,124 @@ def suggest_measurements(image: np.ndarray, pixels_per_mm: float) -> List[Measur
     cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
     cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
     
-    # Trouver les contours
-    contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Préfiltre de toutes les composantes en un appel, sur leur boîte
+    # englobante : elle majore l'aire du contour externe, contrairement au
+    # nombre de pixels (CC_STAT_AREA), le seuillage adaptatif ne gardant
+    # souvent que le pourtour des objets
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(cleaned, connectivity=8)
+    boxes = stats[1:, :4]  # sans le fond
+    candidates = np.flatnonzero(boxes[:, 2] * boxes[:, 3] >= min_area) + 1
     
-    # Filtrer et analyser les contours
-    for contour in contours:
+    # Garder les SUGGEST_TOP_K contours les plus compacts : contour externe
+    # de chaque composante retenue (y compris dans le trou d'une autre),
+    # filtré sur son aire exacte
+    heap: List[Tuple[float, int, np.ndarray]] = []
+    for label in candidates:
+        x, y, w, h = stats[label, :4]
+        mask = cv2.compare(labels[y:y + h, x:x + w], int(label), cv2.CMP_EQ)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                       offset=(int(x), int(y)))
+        contour = max(contours, key=len)
+        
         area = cv2.contourArea(contour)
-        if area < 1000:  # Ignorer les petits contours
+        if area < min_area:
             continue
         
+        # Calculer la confiance basée sur la régularité du contour
+        perimeter = cv2.arcLength(contour, True)
+        confidence = min(4 * np.pi * area / (perimeter * perimeter), 1.0)
+        
+        entry = (confidence, -int(label), contour)
+        if len(heap) < SUGGEST_TOP_K:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    
+    suggestions = []
+    for confidence, _, contour in sorted(heap, key=lambda e: e[:2], reverse=True):
         # Approximer le contour
         epsilon = 0.02 * cv2.arcLength(contour, True)
         approx = cv2.approxPolyDP(contour, epsilon, True)
         
-        # Convertir en liste de points
-        points = approx.reshape(-1, 2).tolist()
-        
-        # Déterminer le type de mesure
-        if len(points) == 2:
-            measure_type = "length"
-        else:
-            measure_type = "area"
-        
-        # Calculer la confiance basée sur la régularité du contour
-        perimeter = cv2.arcLength(contour, True)
-        compactness = 4 * np.pi * area / (perimeter * perimeter)
-        confidence = min(compactness, 1.0)
+        # Revenir aux coordonnées de l'image complète
+        points = approx.reshape(-1, 2) * factor + (factor - 1) / 2.0 + (x0, y0)
         
         suggestions.append(MeasurementSuggestion(
-            mask_poly=points,
+            mask_poly=points.tolist(),
             confidence=confidence,
-            type=measure_type
+            type="length" if len(points) == 2 else "area"
         ))
     
-    # Trier par confiance décroissante
-    suggestions.sort(key=lambda x: x.confidence, reverse=True)
+    return suggestions
+
+def annotate_image(image_path: str, marker_corners: Optional[List[List[float]]],
+                  suggestions: List[MeasurementSuggestion],
+                  timer: Optional[StageTimer] = None) -> str:
+    """
+    Enregistrer l'annotation de l'image et retourner son nom.
+    L'image n'est dessinée ici qu'en mode AI_ANNOTATED_MODE=sync.
+    """
+    name = annotation_renderer.create(
+        image_path, marker_corners, [suggestion.model_dump() for suggestion in suggestions]
+    )
+    storage.link(name, image_path)
+    if annotation_renderer.mode == "sync":
+        annotation_renderer.render(annotation_renderer.filename(name), load_image, timer)
     
-    # Limiter à 5 suggestions
-    return suggestions[:5]
+    return name
 
-def annotate_image(image: np.ndarray, marker_corners: Optional[np.ndarray], 
-                  suggestions: List[MeasurementSuggestion]) -> str:
+def render_annotation(filename: str, cache_decoded: bool = True) -> Tuple[bool, Dict[str, float]]:
     """
-    Annoter l'image avec les détections et sauvegarder.
+    Rendre une image annotée (ou sa miniature) ; exécuté dans le pool.
+    Retourne le succès et la durée des étapes.
     """
-    annotated = image.copy()
+    timer = StageTimer()
     
-    # Dessiner le marqueur A4 si détecté
-    if marker_corners is not None:
-        cv2.drawContours(annotated, [marker_corners.astype(int)], -1, (0, 255, 0), 3)
-        
-        # Ajouter des labels aux coins
-        for i, corner in enumerate(marker_corners):
-            cv2.circle(annotated, tuple(corner.astype(int)), 8, (0, 255, 0), -1)
-            cv2.putText(annotated, f"C{i+1}", tuple(corner.astype(int) + 10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-    
-    # Dessiner les suggestions
-    for i, suggestion in enumerate(suggestions):
-        points = np.array(suggestion.mask_poly, dtype=np.int32)
-        color = (255, 0, 0) if suggestion.type == "area" else (0, 0, 255)
-        
-        if suggestion.type == "area":
-            cv2.drawContours(annotated, [points], -1, color, 2)
-        else:
-            cv2.polylines(annotated, [points], False, color, 2)
-        
-        # Ajouter un label de confiance
-        center = np.mean(points, axis=0).astype(int)
-        cv2.putText(annotated, f"{suggestion.confidence:.2f}", tuple(center), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    def loader(path: str, flags: int) -> Optional[np.ndarray]:
+        return load_image(path, flags, cache_decoded)
     
-    # Sauvegarder l'image annotée
-    filename = f"annotated_{uuid.uuid4().hex}.jpg"
-    filepath = PROCESSED_DIR / filename
-    cv2.imwrite(str(filepath), annotated)
+    rendered = annotation_renderer.render(filename, loader, timer)
+    return rendered, timer.timings
+
+async def run_in_pool(fn, *args):
+    """
+    Exécuter `fn(*args)` dans le pool. Pendant un profilage, le worker est
+    lui aussi échantillonné et ses piles rejoignent celles du service.
+    """
+    if profiler.active and executor.mode == "process":
+        result, samples = await executor.run(profiled_call, profiler.interval, fn, *args)
+        profiler.merge(samples)
+        return result
+    return await executor.run(fn, *args)
+
+# Rendus en cours, pour ne pas dessiner deux fois la même image
+_pending_renders: Dict[str, "asyncio.Future[bool]"] = {}
+
+async def render_annotation_once(filename: str) -> bool:
+    """Rendre une image annotée dans le pool, en partageant un rendu déjà en cours."""
+    task = _pending_renders.get(filename)
+    if task is None:
+        task = asyncio.ensure_future(render_and_record(filename))
+        _pending_renders[filename] = task
+        task.add_done_callback(lambda _: _pending_renders.pop(filename, None))
+    return await asyncio.shield(task)
+
+async def render_and_record(filename: str) -> bool:
+    rendered, timings = await run_in_pool(render_annotation, filename)
+    observe_stages(timings)
+    return rendered
+
+def schedule_annotation(annotated_url: str) -> None:
+    """
+    En mode `background`, rendre l'image annotée après la réponse si un
+    worker est libre ; sinon elle le sera au premier GET.
+    """
+    if annotation_renderer.mode != "background" or executor.in_flight >= executor.workers:
+        return
     
-    return f"/processed/{filename}"
+    task = asyncio.ensure_future(render_annotation_once(Path(annotated_url).name))
+    # Un échec ici n'est pas bloquant : le GET retentera le rendu
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
 @app.get("/")
 async def root():
@@ -254,152 +843,1487 @@ async def root():
     return {
         "service": "Service IA de Mesure Menui",
         "version": "1.0.0",
-        "endpoints": ["/analyze", "/warp", "/health"]
+        "endpoints": ["/analyze", "/analyze/batch", "/analyze/fusion", "/warp", "/measure", "/health",
+                      "/ready", "/metrics", "/ws/track", "/admin/storage"]
     }
 
 @app.get("/health")
 async def health_check():
-    """Vérification de l'état du service."""
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    """
+    Vivacité du service : toujours 200 tant que le processus répond.
+    Un pool plein est signalé dans le corps (`status` "saturated"), la
+    charge se suit par `/metrics`.
+    """
+    saturated = executor.saturated
+    return {
+        "status": "saturated" if saturated else "healthy",
+        "ready": startup_state["ready"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "pool": {
+            "mode": executor.mode,
+            "workers": executor.workers,
+            "in_flight": executor.in_flight,
+            "queue_depth": executor.queue_depth,
+            "capacity": executor.capacity,
+            "saturated": saturated
+        }
+    }
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze(
-    file: UploadFile = File(...),
-    metadata: Optional[str] = Form(None)
-):
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métriques au format texte Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/storage")
+async def storage_usage(refresh: bool = Query(False)):
     """
-    Analyser une image pour détecter le marqueur A4 et suggérer des mesures.
+    Usage du stockage (uploads/, processed/, métadonnées, cache de résultats)
+    au dernier nettoyage. `?refresh=true` lance une passe de nettoyage et
+    renvoie son rapport.
+    """
+    report = storage.last_report
+    if refresh or report is None:
+        report = await collect_storage()
+    cache_usage = await asyncio.to_thread(result_cache.usage)
+    return {**report, "result_cache": cache_usage}
+
+def profiling_endpoint_enabled() -> None:
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.post("/debug/profile/start")
+async def start_profiling(interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """Démarrer le profileur par échantillonnage (service et workers du pool)."""
+    profiling_endpoint_enabled()
+    if not profiler.active:
+        profiler.interval = interval_ms / 1000
+        profiler.start()
+    return {"active": True, "interval_ms": profiler.interval * 1000, "started_at": profiler.started_at}
+
+@app.post("/debug/profile/stop")
+async def stop_profiling():
+    """Arrêter le profileur et renvoyer les piles au format "collapsed" (flamegraph)."""
+    profiling_endpoint_enabled()
+    return PlainTextResponse(collapsed(profiler.stop()))
+
+def read_image(image_path: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+    """
+    Décoder une image directement depuis le fichier projeté en mémoire (mmap),
+    sans copie intermédiaire des octets. Retourne None si l'image est illisible.
     """
     try:
-        # Sauvegarder le fichier uploadé
-        file_id = uuid.uuid4().hex
-        file_path = UPLOAD_DIR / f"{file_id}_{file.filename}"
-        
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-        
-        # Lire l'image avec OpenCV
-        nparr = np.frombuffer(content, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            nparr = np.frombuffer(mm, np.uint8)
+            try:
+                image = cv2.imdecode(nparr, flags)
+            except cv2.error:
+                # Intercepté ici : la trace de l'exception garderait la vue
+                # exportée et la fermeture du mmap lèverait BufferError
+                image = None
+            finally:
+                # Libérer la vue avant la fermeture du mmap
+                del nparr
+            return image
+    except (OSError, ValueError):
+        # Fichier absent ou vide (mmap refuse une taille nulle)
+        return None
+
+def load_image(image_path: str, flags: int = cv2.IMREAD_COLOR,
+               cache: bool = True) -> Optional[np.ndarray]:
+    """
+    Décoder une image en passant par le cache des images décodées.
+    L'image renvoyée est en lecture seule. Avec `cache=False`, une image
+    absente du cache n'y est pas ajoutée.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    
+    key = (os.path.realpath(image_path), stat.st_mtime_ns, stat.st_size, flags)
+    image = decoded_cache.get(key)
+    if image is None:
+        image = read_image(image_path, flags)
+        if image is not None and cache:
+            decoded_cache.put(key, image)
+    return image
+
+def run_analysis(image_path: str, image_ref: Optional[str] = None,
+                 decode_factor: int = 1, cache_decoded: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Pipeline complet d'analyse : décodage, détection A4, suggestions, annotation.
+    Exécuté dans un worker du pool, retourne les champs de AnalyzeResponse et
+    les statistiques du traitement (durée des étapes en secondes, mégapixels).
+    `image_ref` est le nom renvoyé dans `image_path` (None pour le volume partagé).
+    
+    Avec `decode_factor` > 1, l'image est décodée réduite (IMREAD_REDUCED_*) ;
+    les coordonnées et pixels_per_mm renvoyés restent exprimés dans l'image d'origine.
+    Avec `cache_decoded=False`, l'image décodée n'est pas gardée en cache.
+    """
+    timer = StageTimer()
+    
+    # Lire l'image avec OpenCV
+    with timer.stage("decode"):
+        image = load_image(image_path, REDUCED_DECODE_FLAGS[decode_factor], cache_decoded)
+    
+    if image is None:
+        raise InvalidImageError("Image invalide")
+    
+    # Détecter le marqueur A4
+    with timer.stage("detect"):
+        detection_result = detect_a4_marker(image, decode_factor)
+    
+    if detection_result is not None:
+        marker_corners, pixels_per_mm = detection_result
+        marker = MarkerDetection(
+            corners=marker_corners.tolist(),
+            confidence=0.95,
+            pixels_per_mm=pixels_per_mm
+        )
         
-        if image is None:
-            raise HTTPException(status_code=400, detail="Image invalide")
+        # Suggérer des mesures
+        with timer.stage("suggest"):
+            suggestions = suggest_measurements(image, pixels_per_mm, marker_corners, decode_factor)
         
-        # Détecter le marqueur A4
-        detection_result = detect_a4_marker(image)
+        # Calculer des mesures préliminaires sur le plan de la feuille, en un seul lot
+        # (une "length" est mesurée entre ses deux premiers points)
+        shapes = [
+            np.array(suggestion.mask_poly[:2] if suggestion.type == "length" else suggestion.mask_poly)
+            for suggestion in suggestions
+        ]
+        with timer.stage("measure"):
+            measures = measure_shapes(
+                marker_corners, shapes, [suggestion.type for suggestion in suggestions],
+                corner_sigma_px=CORNER_SIGMA_PX / decode_factor
+            )
+        preliminary_measurements = [
+            {"id": i, **measure, "confidence": suggestion.confidence}
+            for i, (suggestion, measure) in enumerate(zip(suggestions, measures))
+            if suggestion.type == "area" or len(suggestion.mask_poly) >= 2
+        ]
         
-        if detection_result is not None:
-            marker_corners, pixels_per_mm = detection_result
-            marker = MarkerDetection(
-                corners=marker_corners.tolist(),
-                confidence=0.95,
-                pixels_per_mm=pixels_per_mm
+        success = True
+        message = "Marqueur A4 détecté avec succès"
+    else:
+        marker_corners = None
+        marker = None
+        pixels_per_mm = None
+        suggestions = []
+        preliminary_measurements = []
+        success = False
+        message = "Aucun marqueur A4 détecté. Veuillez vous assurer que la feuille A4 est visible et bien éclairée."
+    
+    if decode_factor > 1:
+        # Revenir aux coordonnées de l'image d'origine (centre des blocs réduits)
+        offset = (decode_factor - 1) / 2.0
+        if marker is not None:
+            marker.corners = (marker_corners * decode_factor + offset).tolist()
+            marker.pixels_per_mm = pixels_per_mm = pixels_per_mm * decode_factor
+        for suggestion in suggestions:
+            suggestion.mask_poly = (
+                np.array(suggestion.mask_poly, dtype=np.float64) * decode_factor + offset
+            ).tolist()
+    
+    # Annoter l'image (coordonnées de l'image d'origine)
+    with timer.stage("annotate"):
+        annotation = annotate_image(image_path, marker.corners if marker else None, suggestions, timer)
+    
+    response = AnalyzeResponse(
+        marker=marker,
+        pixels_per_mm=pixels_per_mm,
+        suggestions=suggestions,
+        preliminary_measurements=preliminary_measurements,
+        annotated_image_url=annotation_renderer.url(annotation),
+        annotated_thumbnail_url=annotation_renderer.url(annotation, thumbnail=True),
+        success=success,
+        message=message,
+        image_path=image_ref
+    ).model_dump(exclude={"timings"})
+    stats = {
+        "timings": timer.timings,
+        "megapixels": image.shape[0] * image.shape[1] * decode_factor ** 2 / 1e6,
+        "detected": success
+    }
+    return response, stats
+
+def warp_geometry(request: WarpRequest) -> Dict[str, Any]:
+    """
+    Homographies et coordonnées redressées d'une requête /warp, sans lire l'image.
+    
+    `homography_matrix` envoie l'image sur la sortie rendue (à `dpi`, limitée
+    à `roi` si fourni) ; `homography_mm` envoie l'image sur le plan de la
+    feuille en mm. Points et polygones sont transformés en un seul appel
+    vectorisé et renvoyés en mm sur ce plan.
+    """
+    src_corners = np.array(request.marker_corners, dtype=np.float32)
+    if src_corners.shape != (4, 2):
+        raise InvalidImageError("marker_corners doit contenir 4 points [x, y]")
+    
+    H_mm = plane_homography(src_corners)
+    
+    # Zone rendue, en mm sur le plan (par défaut la feuille entière)
+    if request.roi is not None:
+        if len(request.roi) != 4 or request.roi[2] <= 0 or request.roi[3] <= 0:
+            raise InvalidImageError("roi doit être [x, y, largeur, hauteur] en mm")
+        roi_x, roi_y, roi_w, roi_h = request.roi
+    else:
+        roi_x, roi_y = 0.0, 0.0
+        roi_w, roi_h = a4_plane_size(src_corners)
+    
+    # Taille de sortie (A4 à 300 DPI ≈ 2480 x 3508 pixels)
+    px_per_mm = request.dpi / 25.4
+    dst_size = (max(1, round(roi_w * px_per_mm)), max(1, round(roi_h * px_per_mm)))
+    
+    # mm -> pixels de sortie, décalés sur la zone rendue
+    to_output = np.array([
+        [px_per_mm, 0, -roi_x * px_per_mm],
+        [0, px_per_mm, -roi_y * px_per_mm],
+        [0, 0, 1]
+    ])
+    H = to_output @ H_mm
+    
+    # Transformer points et polygones en un seul appel
+    points = request.points or []
+    polygons = request.polygons or []
+    if any(len(point) != 2 for point in points):
+        raise InvalidImageError("points doit contenir des points [x, y]")
+    if any(len(point) != 2 for polygon in polygons for point in polygon):
+        raise InvalidImageError("polygons doit contenir des listes de points [x, y]")
+    arrays = [np.array(points, dtype=np.float64).reshape(-1, 2)]
+    arrays += [np.array(polygon, dtype=np.float64).reshape(-1, 2) for polygon in polygons]
+    mapped = transform_points(H_mm, np.concatenate(arrays))
+    split_at = np.cumsum([len(a) for a in arrays])[:-1]
+    mapped_arrays = np.split(mapped, split_at)
+    
+    return {
+        "homography_matrix": H.tolist(),
+        "homography_mm": H_mm.tolist(),
+        "output_size": list(dst_size),
+        "roi_mm": [roi_x, roi_y, roi_w, roi_h],
+        "points_mm": mapped_arrays[0].tolist() if request.points is not None else None,
+        "polygons_mm": [a.tolist() for a in mapped_arrays[1:]] if request.polygons is not None else None,
+    }
+
+def run_warp(image_path: str, decode_factor: int, geometry: Dict[str, Any],
+             cache_decoded: bool = True) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Redresser l'image sur le plan de la feuille A4 (exécuté dans un worker du pool).
+    L'image est décodée au même facteur de réduction que pour /analyze,
+    ce qui permet de réutiliser l'image décodée en cache.
+    Retourne le résultat et la durée des étapes.
+    """
+    timer = StageTimer()
+    with timer.stage("decode"):
+        image = load_image(image_path, REDUCED_DECODE_FLAGS[decode_factor], cache_decoded)
+    if image is None:
+        raise InvalidImageError("Impossible de lire l'image")
+    
+    # Coordonnées d'origine -> image réduite
+    H = np.array(geometry["homography_matrix"], dtype=np.float64)
+    if decode_factor > 1:
+        offset = (decode_factor - 1) / 2.0
+        to_original = np.array([
+            [decode_factor, 0, offset],
+            [0, decode_factor, offset],
+            [0, 0, 1]
+        ])
+        H = H @ to_original
+    
+    # Appliquer la transformation
+    dst_size = tuple(geometry["output_size"])
+    with timer.stage("warp"):
+        warped = cv2.warpPerspective(image, H, dst_size)
+    
+    # Sauvegarder l'image transformée
+    filename = f"warped_{uuid.uuid4().hex}.jpg"
+    filepath = storage.processed.create_path(filename)
+    with timer.stage("warp_write"):
+        cv2.imwrite(str(filepath), warped)
+    storage.link(filename, image_path)
+    
+    return {**geometry, "warped_image_url": f"/processed/{filename}"}, timer.timings
+
+def image_decode_factor(path: Path) -> int:
+    """Facteur de réduction au décodage d'une image, d'après son en-tête."""
+    return reduced_decode_factor(read_image_header(path, SNIFF_MAX_BYTES), MAX_DECODE_PIXELS)
+
+def pool_saturated_exception(exc: PoolSaturatedError) -> HTTPException:
+    """Réponse 503 avec Retry-After quand le pool d'analyse est plein."""
+    POOL_REJECTIONS.inc()
+    return HTTPException(
+        status_code=503,
+        detail=f"Service d'analyse saturé ({exc.in_flight}/{exc.capacity}), veuillez réessayer plus tard",
+        headers={"Retry-After": os.getenv("AI_RETRY_AFTER_SECONDS", "5")}
+    )
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """
+    Refuser sur Content-Length, avant la lecture du corps multipart,
+    les requêtes /analyze manifestement trop volumineuses.
+    """
+    if request.method == "POST" and request.url.path.startswith("/analyze"):
+        max_files = {"/analyze/batch": BATCH_MAX_FILES, "/analyze/fusion": FUSION_MAX_FILES}.get(
+            request.url.path, 1
+        )
+        limit = MAX_UPLOAD_BYTES * max_files + 64 * 1024  # marge pour l'enveloppe multipart
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Requête trop volumineuse (maximum {limit} octets)"}
             )
-            
-            # Suggérer des mesures
-            suggestions = suggest_measurements(image, pixels_per_mm)
-            
-            # Calculer des mesures préliminaires
-            preliminary_measurements = []
-            for i, suggestion in enumerate(suggestions):
-                if suggestion.type == "area":
-                    area_px = cv2.contourArea(np.array(suggestion.mask_poly, dtype=np.int32))
-                    area_mm2 = area_px / (pixels_per_mm ** 2)
-                    area_m2 = area_mm2 / 1_000_000
-                    
-                    preliminary_measurements.append({
-                        "id": i,
-                        "type": "area",
-                        "value_mm2": area_mm2,
-                        "value_m2": area_m2,
-                        "confidence": suggestion.confidence
-                    })
-                else:
-                    points = np.array(suggestion.mask_poly)
-                    if len(points) >= 2:
-                        length_px = np.linalg.norm(points[1] - points[0])
-                        length_mm = length_px / pixels_per_mm
-                        
-                        preliminary_measurements.append({
-                            "id": i,
-                            "type": "length",
-                            "value_mm": length_mm,
-                            "confidence": suggestion.confidence
-                        })
-            
-            success = True
-            message = "Marqueur A4 détecté avec succès"
+    return await call_next(request)
+
+def route_label(request: Request) -> str:
+    """Gabarit de la route (et non le chemin brut) pour borner les séries de métriques."""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for mount in ("/uploads", "/processed"):
+        if request.url.path.startswith(mount + "/"):
+            return mount
+    return "unmatched"
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Requêtes en cours et durée par route dans /metrics."""
+    REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=route_label(request), method=request.method, status=str(status_code)
+        )
+
+async def collect_storage() -> Dict[str, Any]:
+    """Passe de nettoyage du stockage (hors de la boucle d'événements) et mise à jour des métriques."""
+    report = await asyncio.to_thread(storage.collect)
+    for area, usage in report["areas"].items():
+        STORAGE_BYTES.set(usage["bytes"], area=area)
+        STORAGE_FILES.set(usage["files"], area=area)
+    for reason, reaped in report["reaped"].items():
+        STORAGE_REAPED.inc(reaped["groups"], reason=reason)
+    return report
+
+async def storage_gc_loop() -> None:
+    while True:
+        try:
+            await collect_storage()
+        except Exception:
+            # Une passe en échec (volume indisponible...) est retentée à la suivante
+            STORAGE_GC_ERRORS.inc()
+        await asyncio.sleep(storage.interval_seconds)
+
+storage_gc_task: Optional["asyncio.Task[None]"] = None
+
+# Démarrage du service, exposé par /ready : durées en secondes
+startup_state: Dict[str, Any] = {"ready": False}
+warmup_task: Optional["asyncio.Task[None]"] = None
+
+@app.on_event("startup")
+async def start_executor():
+    global storage_gc_task, warmup_task
+    started = time.perf_counter()
+    startup_state["import_seconds"] = started - MODULE_IMPORT_STARTED
+    executor.start()
+    await asyncio.to_thread(result_cache.setup)
+    await asyncio.to_thread(result_cache.evict)
+    if storage.interval_seconds > 0:
+        storage_gc_task = asyncio.create_task(storage_gc_loop())
+    startup_state["setup_seconds"] = time.perf_counter() - started
+    # Le service accepte les connexions pendant le préchauffage : /health
+    # répond, /ready reste à 503 jusqu'à la fin
+    warmup_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def stop_executor():
+    for task in (storage_gc_task, warmup_task):
+        if task is not None:
+            task.cancel()
+    executor.shutdown()
+
+def check_image_header(header: Optional[ImageHeader]) -> None:
+    """
+    Refuser les formats non décodables, les images démesurées et celles
+    dont les dimensions sont introuvables (la taille décodée serait inconnue).
+    """
+    if header is None:
+        raise HTTPException(status_code=415, detail="Format d'image non reconnu")
+    if header.format not in SUPPORTED_FORMATS:
+        raise HTTPException(status_code=415, detail=f"Format d'image non supporté: {header.format}")
+    if header.pixels is None:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Dimensions introuvables dans l'en-tête de l'image ({header.format})"
+        )
+    if header.pixels > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image trop grande ({header.width}x{header.height} pixels)"
+        )
+
+def upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Fichier trop volumineux (maximum {MAX_UPLOAD_BYTES // (1024 * 1024)} Mo)"
+    )
+
+async def ingest_upload(file: UploadFile) -> Tuple[Path, str, int]:
+    """
+    Copier un upload dans uploads/ par blocs, sans le charger entièrement en mémoire.
+    
+    Le format et les dimensions sont identifiés sur les premiers blocs : un
+    fichier non supporté ou démesuré est refusé avant d'écrire quoi que ce soit.
+    Seule exception, un TIFF dont le premier IFD (les dimensions) est au-delà
+    de ces blocs est vérifié une fois copié. Le contenu est haché pendant
+    l'écriture. Retourne le chemin, l'empreinte SHA-256 et le facteur de
+    réduction à utiliser au décodage.
+    """
+    head = b""
+    header = None
+    while len(head) < SNIFF_MAX_BYTES:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        head += chunk
+        header = sniff_image_header(head)
+        if header is None or header.pixels is not None:
+            break
+    
+    # IFD plus loin dans le fichier : lu après la copie
+    tiff_ifd_later = header is not None and header.format == "tiff" and header.pixels is None
+    if not tiff_ifd_later:
+        check_image_header(header)
+    if len(head) > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    
+    file_path = storage.uploads.create_path(f"{uuid.uuid4().hex}_{Path(file.filename or 'image').name}")
+    digest = hashlib.sha256(head)
+    size = len(head)
+    
+    try:
+        async with aiofiles.open(file_path, 'wb') as f:
+            await f.write(head)
+            del head
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                digest.update(chunk)
+                await f.write(chunk)
+        if tiff_ifd_later:
+            header = await asyncio.to_thread(read_image_header, file_path, SNIFF_MAX_BYTES)
+            check_image_header(header)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+    
+    return file_path, digest.hexdigest(), reduced_decode_factor(header, MAX_DECODE_PIXELS)
+
+def analysis_params() -> Dict[str, Any]:
+    """Paramètres qui influencent le résultat d'analyse (inclus dans la clé de cache)."""
+    return {
+        "corner_sigma_px": CORNER_SIGMA_PX,
+        "detect_max_side": DETECT_MAX_SIDE,
+        "max_decode_pixels": MAX_DECODE_PIXELS,
+        "suggest_max_side": SUGGEST_MAX_SIDE,
+        "suggest_roi_margin": SUGGEST_ROI_MARGIN,
+    }
+
+def ingest_shared_file(path: Path) -> Tuple[str, int]:
+    """
+    Vérifier une image du volume partagé (taille, format, dimensions)
+    puis la hacher par blocs. Retourne l'empreinte SHA-256 et le facteur
+    de réduction à utiliser au décodage.
+    """
+    if path.stat().st_size > MAX_UPLOAD_BYTES:
+        raise upload_too_large()
+    
+    header = read_image_header(path, SNIFF_MAX_BYTES)
+    check_image_header(header)
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    
+    return digest.hexdigest(), reduced_decode_factor(header, MAX_DECODE_PIXELS)
+
+def resolve_shared_path(relative_path: str) -> Path:
+    """
+    Résoudre un chemin sur le volume partagé en refusant toute sortie
+    de AI_SHARED_ROOT (chemins absolus, `..`, liens symboliques).
+    """
+    if SHARED_ROOT is None:
+        raise HTTPException(status_code=400, detail="Analyse par chemin non configurée (AI_SHARED_ROOT)")
+    
+    resolved = (SHARED_ROOT / relative_path).resolve()
+    if not resolved.is_relative_to(SHARED_ROOT):
+        raise HTTPException(status_code=403, detail="Chemin hors du volume partagé")
+    if not resolved.is_file():
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+    
+    return resolved
+
+def cached_analysis(key: str) -> Optional[AnalyzeResponse]:
+    """
+    Réponse en cache pour cette clé, si les fichiers qu'elle référence
+    (upload d'origine éventuel et image annotée) existent toujours.
+    """
+    cached = result_cache.get(key)
+    if cached is None:
+        return None
+    
+    annotated = Path(cached["annotated_image_url"]).name
+    parsed = annotation_renderer.parse(annotated)
+    if parsed is not None:
+        annotated_available = annotation_renderer.available(parsed[0])
+    else:
+        annotated_available = storage.processed.locate(annotated) is not None
+    
+    source = cached.get("image_path")
+    if not annotated_available or (source and storage.uploads.locate(Path(source).name) is None):
+        result_cache.invalidate(key)
+        return None
+    
+    return AnalyzeResponse(**{**cached, "cache_hit": True})
+
+def attach_cached_upload(key: str, cached: AnalyzeResponse, image_path: Path, is_upload: bool) -> None:
+    """
+    Fichiers d'un hit de cache : l'upload de référence est marqué comme
+    utilisé ; une nouvelle copie est supprimée, ou devient l'upload de
+    référence de l'entrée si celle-ci n'en a pas encore.
+    """
+    if cached.image_path:
+        # Garder l'upload de référence (et ses artefacts) hors du nettoyage
+        storage.touch(cached.image_path)
+    if is_upload:
+        if cached.image_path:
+            image_path.unlink(missing_ok=True)
         else:
-            marker = None
-            pixels_per_mm = None
-            suggestions = []
-            preliminary_measurements = []
-            success = False
-            message = "Aucun marqueur A4 détecté. Veuillez vous assurer que la feuille A4 est visible et bien éclairée."
+            # Première copie de cette image : la rattacher à l'entrée
+            cached.image_path = image_path.name
+            storage.link(Path(cached.annotated_image_url).name, str(image_path))
+            result_cache.put(key, cached.model_dump(exclude={"cache_hit", "timings"}))
+
+async def analyze_image(image_path: Path, digest: str, decode_factor: int,
+                        is_upload: bool, timer: Optional[StageTimer] = None) -> AnalyzeResponse:
+    """
+    Analyser une image sur disque (copie d'upload ou fichier du volume partagé),
+    en passant par le cache. En cas de hit sur un upload, la copie est supprimée
+    si la réponse en cache référence déjà un upload d'origine, sinon elle
+    devient l'upload de référence de l'entrée.
+    
+    La durée des étapes est ajoutée à `timer` ; "queue" est le temps passé
+    dans le pool hors des étapes du worker (attente d'un worker, transferts).
+    """
+    timer = timer or StageTimer()
+    key = result_cache.key(digest, analysis_params())
+    with timer.stage("cache_lookup"):
+        # Lecture du JSON et vérification des fichiers hors de la boucle d'événements
+        cached = await asyncio.to_thread(cached_analysis, key)
+    if result_cache.enabled:
+        CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+    if cached is not None:
+        await asyncio.to_thread(attach_cached_upload, key, cached, image_path, is_upload)
+        return cached
+    
+    image_ref = image_path.name if is_upload else None
+    start = time.perf_counter()
+    result, stats = await run_in_pool(run_analysis, str(image_path), image_ref, decode_factor)
+    elapsed = time.perf_counter() - start
+    timer.update(stats["timings"])
+    timer.add("queue", max(0.0, elapsed - sum(stats["timings"].values())))
+    
+    IMAGE_MEGAPIXELS.observe(stats["megapixels"])
+    PROCESSED_MEGAPIXELS.inc(stats["megapixels"])
+    DETECTIONS.inc(result="success" if stats["detected"] else "failure")
+    
+    await asyncio.to_thread(result_cache.put, key, result)
+    schedule_annotation(result["annotated_image_url"])
+    return AnalyzeResponse(**result)
+
+def finish_timings(response: AnalyzeResponse, timer: StageTimer, start: float,
+                   include: bool) -> AnalyzeResponse:
+    """Enregistrer les étapes dans /metrics et, si demandé, les joindre à la réponse (ms)."""
+    observe_stages(timer.timings)
+    if include:
+        response.timings = {**timer.milliseconds(), "total": round((time.perf_counter() - start) * 1000, 3)}
+    return response
+
+def parse_batch_metadata(metadata: Optional[str], count: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Métadonnées d'un lot : une liste JSON alignée sur les fichiers,
+    ou un objet JSON unique appliqué à toutes les images.
+    """
+    if not metadata:
+        return [None] * count
+    
+    try:
+        parsed = json.loads(metadata)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Métadonnées JSON invalides")
+    
+    if isinstance(parsed, dict):
+        return [parsed] * count
+    if isinstance(parsed, list) and len(parsed) == count:
+        return [item if isinstance(item, dict) else None for item in parsed]
+    
+    raise HTTPException(
+        status_code=400,
+        detail="Les métadonnées doivent être un objet ou une liste de même taille que les fichiers"
+    )
+
+async def ingest_uploads(files: List[UploadFile]) -> Tuple[List[Any], List[StageTimer]]:
+    """
+    Copier les uploads d'un lot. Un fichier refusé à l'ingestion n'invalide
+    pas le reste du lot : il est remplacé par son HTTPException.
+    """
+    uploads: List[Any] = []
+    timers: List[StageTimer] = []
+    for file in files:
+        timer = StageTimer()
+        timers.append(timer)
+        try:
+            with timer.stage("upload"):
+                uploads.append(await ingest_upload(file))
+        except HTTPException as e:
+            uploads.append(e)
+    return uploads, timers
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze(
+    file: Optional[UploadFile] = File(None),
+    path: Optional[str] = Form(None),
+    metadata: Optional[str] = Form(None),
+    timings: bool = Query(False)
+):
+    """
+    Analyser une image pour détecter le marqueur A4 et suggérer des mesures.
+    
+    L'image est soit envoyée (`file`), soit désignée par `path`, relatif au
+    volume partagé AI_SHARED_ROOT : elle est alors lue sur place, sans copie
+    dans uploads/. Avec `?timings=true`, la réponse détaille la durée des étapes.
+    
+    Un résultat en cache est renvoyé même quand le pool est plein : la
+    saturation (`503`) n'est vérifiée qu'en cas d'échec du cache, par
+    `executor.run`.
+    """
+    start = time.perf_counter()
+    timer = StageTimer()
+    if (file is None) == (path is None):
+        raise HTTPException(status_code=400, detail="Fournir exactement un champ parmi 'file' et 'path'")
+    
+    try:
+        if path is not None:
+            shared_path = resolve_shared_path(path)
+            with timer.stage("shared_read"):
+                digest, decode_factor = await asyncio.to_thread(ingest_shared_file, shared_path)
+            response = await analyze_image(shared_path, digest, decode_factor, False, timer)
+            return finish_timings(response, timer, start, timings)
         
-        # Annoter l'image
-        annotated_url = annotate_image(
-            image, 
-            marker_corners if detection_result else None,
-            suggestions
-        )
+        # Sauvegarder le fichier uploadé
+        with timer.stage("upload"):
+            file_path, digest, decode_factor = await ingest_upload(file)
         
-        return AnalyzeResponse(
-            marker=marker,
-            pixels_per_mm=pixels_per_mm,
-            suggestions=suggestions,
-            preliminary_measurements=preliminary_measurements,
-            annotated_image_url=annotated_url,
-            success=success,
-            message=message
-        )
+        try:
+            response = await analyze_image(file_path, digest, decode_factor, True, timer)
+        except PoolSaturatedError:
+            # Le client renverra l'image : cette copie ne servirait à rien
+            file_path.unlink(missing_ok=True)
+            raise
+        return finish_timings(response, timer, start, timings)
         
+    except PoolSaturatedError as e:
+        raise pool_saturated_exception(e)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    metadata: Optional[str] = Form(None),
+    timings: bool = Query(False)
+):
+    """
+    Analyser plusieurs images en parallèle.
+    
+    La réponse est un flux NDJSON : une ligne BatchItemResult par image,
+    émise dès que son analyse est terminée (l'ordre n'est donc pas garanti,
+    utiliser `index` ou `metadata` pour faire la correspondance).
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop d'images dans le lot (maximum {BATCH_MAX_FILES})"
+        )
+    if executor.saturated:
+        raise pool_saturated_exception(
+            PoolSaturatedError(executor.in_flight, executor.capacity)
+        )
+    
+    items_metadata = parse_batch_metadata(metadata, len(files))
+    
+    # Copier tous les uploads avant de répondre : les fichiers temporaires
+    # du formulaire peuvent être fermés pendant le streaming
+    uploads, timers = await ingest_uploads(files)
+    
+    # Ne pas occuper plus de workers que le pool n'en a, pour laisser
+    # la file d'attente aux autres requêtes
+    semaphore = asyncio.Semaphore(executor.workers)
+    
+    async def process(index: int) -> BatchItemResult:
+        item = BatchItemResult(
+            index=index,
+            filename=files[index].filename,
+            metadata=items_metadata[index],
+            status_code=200
+        )
+        upload = uploads[index]
+        if isinstance(upload, HTTPException):
+            item.status_code = upload.status_code
+            item.error = upload.detail
+            return item
+        try:
+            start = time.perf_counter()
+            async with semaphore:
+                result = await analyze_image(*upload, True, timers[index])
+            item.result = finish_timings(result, timers[index], start, timings)
+        except PoolSaturatedError as e:
+            item.status_code = 503
+            item.error = str(e)
+        except InvalidImageError as e:
+            item.status_code = 400
+            item.error = str(e)
+        except Exception as e:
+            item.status_code = 500
+            item.error = str(e)
+        return item
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(process(i)) for i in range(len(files))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client déconnecté : ne pas laisser tourner les analyses restantes
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def fuse_frames(frames: List[FusionFrame],
+                results: List[Optional[AnalyzeResponse]]) -> Tuple[Optional[int], List[FusedMeasurement], int]:
+    """
+    Ramener les mesures des photos analysées sur le plan de la feuille et les
+    fusionner (voir fusion.py). Complète `frames` (statut, homographies,
+    score) ; retourne la photo de référence, les mesures fusionnées et le
+    nombre de photos retenues.
+    """
+    detected = [index for index, result in enumerate(results) if result is not None]
+    
+    def project(local: int, H: np.ndarray) -> List[FrameMeasure]:
+        """Mesures d'une photo projetées sur le plan par H, en un seul appel."""
+        result = results[detected[local]]
+        kept = [m for m in result.preliminary_measurements if m["id"] < len(result.suggestions)]
+        polygons = []
+        for measure in kept:
+            points = np.array(result.suggestions[measure["id"]].mask_poly, dtype=np.float64).reshape(-1, 2)
+            polygons.append(points[:2] if measure["type"] == "length" else points)
+        if not polygons:
+            return []
+        plane = transform_points(H, np.concatenate(polygons))
+        split_at = np.cumsum([len(points) for points in polygons])[:-1]
+        frame_measures = []
+        for measure, plane_points in zip(kept, np.split(plane, split_at)):
+            unit = "mm2" if measure["type"] == "area" else "mm"
+            frame_measures.append(FrameMeasure(
+                frame=local,
+                type=measure["type"],
+                value=measure[f"value_{unit}"],
+                uncertainty=measure[f"uncertainty_{unit}"],
+                confidence=measure["confidence"],
+                plane_points=plane_points,
+            ))
+        return frame_measures
+    
+    # Orientation de la feuille : les photos les plus résolues d'abord, chacune
+    # placée à 0° ou 180° (seules rotations compatibles avec le format A4 du
+    # plan de la première) selon l'accord avec les mesures déjà placées
+    order = sorted(range(len(detected)), key=lambda local: -results[detected[local]].marker.pixels_per_mm)
+    homographies: List[Optional[np.ndarray]] = [None] * len(detected)
+    measures: List[FrameMeasure] = []
+    plane_size = None
+    for local in order:
+        corners = np.array(results[detected[local]].marker.corners, dtype=np.float64)
+        if plane_size is None:
+            plane_size = a4_plane_size(corners)
+        best = None
+        for shift in range(4):
+            rolled = np.roll(corners, -shift, axis=0)
+            if a4_plane_size(rolled) != plane_size:
+                continue
+            H = plane_homography(rolled)
+            candidate = project(local, H)
+            cost = alignment_cost(candidate, measures)
+            if best is None or cost < best[0]:
+                best = (cost, H, candidate)
+        _, H, candidate = best
+        homographies[local] = H
+        frames[detected[local]].homography_mm = H.tolist()
+        measures.extend(candidate)
+    
+    if len(detected) < 2:
+        for index in detected:
+            frames[index].status = "used"
+        return (detected[0] if detected else None), [], len(detected)
+    
+    fused = fuse_measures(measures, len(detected))
+    outliers = {detected[local] for local in fused["outlier_frames"]}
+    for local, index in enumerate(detected):
+        score = fused["scores"][local]
+        frames[index].outlier_score = None if np.isnan(score) else float(score)
+        frames[index].status = "outlier" if index in outliers else "used"
+    
+    # Référence : la photo retenue où la feuille est la plus résolue
+    used = [local for local, index in enumerate(detected) if index not in outliers]
+    reference_local = max(used, key=lambda local: results[detected[local]].marker.pixels_per_mm)
+    to_reference_image = np.linalg.inv(homographies[reference_local])
+    for local, index in enumerate(detected):
+        to_reference = to_reference_image @ homographies[local]
+        frames[index].to_reference = (to_reference / to_reference[2, 2]).tolist()
+    
+    measurements = []
+    for i, result in enumerate(fused["measurements"]):
+        value = result["value"]
+        values = {"value_mm2": value, "value_m2": value / 1_000_000} if result["type"] == "area" else {"value_mm": value}
+        measurements.append(FusedMeasurement(
+            id=i,
+            type=result["type"],
+            **values,
+            std=result["std"],
+            standard_error=result["standard_error"],
+            ci95=result["ci95"],
+            confidence=result["confidence"],
+            frames=[detected[local] for local in result["frames"]],
+            rejected_frames=[detected[local] for local in result["rejected_frames"]],
+            plane_poly=result["plane_points"].tolist(),
+            reference_poly=transform_points(to_reference_image, result["plane_points"]).tolist(),
+        ))
+    return detected[reference_local], measurements, len(used)
+
+@app.post("/analyze/fusion", response_model=FusionResponse)
+async def analyze_fusion(files: List[UploadFile] = File(...)):
+    """
+    Analyser plusieurs photos d'une même surface, la feuille A4 restant en
+    place, et fusionner leurs mesures.
+    
+    Chaque photo passe par l'analyse habituelle (en parallèle, avec le
+    cache). Les mesures sont ramenées sur le plan de la feuille (orientée
+    d'une photo à l'autre, à 0° ou 180°), appariées entre photos, les photos incohérentes sont écartées, et chaque
+    zone vue sur au moins deux photos est renvoyée avec son intervalle de
+    confiance à 95 % tiré de la dispersion entre photos.
+    """
+    if len(files) < 2:
+        raise HTTPException(status_code=400, detail="Au moins deux photos sont nécessaires")
+    if len(files) > FUSION_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Trop de photos (maximum {FUSION_MAX_FILES})"
+        )
+    if executor.saturated:
+        raise pool_saturated_exception(
+            PoolSaturatedError(executor.in_flight, executor.capacity)
+        )
+    
+    uploads, timers = await ingest_uploads(files)
+    frames = [FusionFrame(index=i, filename=file.filename, status="error") for i, file in enumerate(files)]
+    semaphore = asyncio.Semaphore(executor.workers)
+    
+    async def process(index: int) -> Optional[AnalyzeResponse]:
+        """Résultat d'analyse d'une photo, None si elle est inutilisable."""
+        frame = frames[index]
+        upload = uploads[index]
+        if isinstance(upload, HTTPException):
+            frame.error = upload.detail
+            return None
+        try:
+            start = time.perf_counter()
+            async with semaphore:
+                result = await analyze_image(*upload, True, timers[index])
+            finish_timings(result, timers[index], start, False)
+        except Exception as e:
+            frame.error = str(e)
+            return None
+        
+        frame.image_path = result.image_path
+        frame.annotated_image_url = result.annotated_image_url
+        if result.marker is None:
+            frame.status = "no_marker"
+            return None
+        frame.marker_corners = result.marker.corners
+        frame.pixels_per_mm = result.marker.pixels_per_mm
+        return result
+    
+    results = await asyncio.gather(*(process(i) for i in range(len(files))))
+    
+    timer = StageTimer()
+    with timer.stage("fusion"):
+        reference, measurements, frames_used = fuse_frames(frames, results)
+    observe_stages(timer.timings)
+    
+    if frames_used < 2:
+        message = "Feuille A4 détectée sur moins de deux photos exploitables"
+    elif not measurements:
+        message = "Aucune zone retrouvée sur au moins deux photos"
+    else:
+        message = f"{len(measurements)} mesure(s) fusionnée(s) sur {frames_used} photos"
+    
+    return FusionResponse(
+        success=frames_used >= 2 and bool(measurements),
+        message=message,
+        reference_frame=reference,
+        frames_used=frames_used,
+        frames=frames,
+        measurements=measurements,
+    )
+
+@app.post("/measure", response_model=MeasureResponse)
+async def measure(request: MeasureRequest):
+    """
+    Mesurer en un appel les polylignes et polygones tracés sur une photo,
+    à partir des coins du marqueur A4 (correction de perspective incluse).
+    """
+    corners = np.array(request.marker_corners, dtype=np.float64)
+    if corners.shape != (4, 2):
+        raise HTTPException(status_code=400, detail="marker_corners doit contenir 4 points [x, y]")
+    if not valid_marker_quad(corners):
+        raise HTTPException(
+            status_code=400,
+            detail="marker_corners doit former un quadrilatère convexe d'aire non nulle"
+        )
+    
+    total_points = 0
+    for index, shape in enumerate(request.shapes):
+        if shape.type not in ("length", "area"):
+            raise HTTPException(status_code=400, detail=f"Forme {index}: type doit valoir 'length' ou 'area'")
+        minimum = 2 if shape.type == "length" else 3
+        if len(shape.points) < minimum or any(len(point) != 2 for point in shape.points):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Forme {index}: au moins {minimum} points [x, y] requis"
+            )
+        total_points += len(shape.points)
+    if total_points > MEASURE_MAX_POINTS:
+        raise HTTPException(status_code=413, detail=f"Trop de points (maximum {MEASURE_MAX_POINTS})")
+    
+    sigma = CORNER_SIGMA_PX if request.corner_sigma_px is None else request.corner_sigma_px
+    measures = measure_shapes(
+        corners,
+        [np.array(shape.points) for shape in request.shapes],
+        [shape.type for shape in request.shapes],
+        corner_sigma_px=sigma
+    )
+    
+    return MeasureResponse(
+        measurements=[
+            ShapeMeasurement(id=shape.id, **measure)
+            for shape, measure in zip(request.shapes, measures)
+        ],
+        plane_size_mm=list(a4_plane_size(corners)),
+        homography_mm=plane_homography(corners).tolist()
+    )
+
 @app.post("/warp")
 async def warp_perspective(request: WarpRequest):
     """
     Appliquer une transformation de perspective pour obtenir une vue de dessus.
+    
+    - `mode="image"` : rend la zone `roi` (par défaut la feuille) à `dpi`.
+    - `mode="homography"` : ne lit pas l'image, renvoie seulement les matrices
+      et les coordonnées redressées de `points`/`polygons`.
     """
+    if request.mode not in ("image", "homography"):
+        raise HTTPException(status_code=400, detail="mode doit valoir 'image' ou 'homography'")
+    if not 0 < request.dpi <= WARP_MAX_DPI:
+        raise HTTPException(status_code=400, detail=f"dpi doit être compris entre 0 et {WARP_MAX_DPI}")
+    
     try:
-        # Charger l'image
-        image_path = UPLOAD_DIR / Path(request.image_path).name
-        if not image_path.exists():
-            raise HTTPException(status_code=404, detail="Image non trouvée")
+        geometry = warp_geometry(request)
+        if request.mode == "homography":
+            return {"mode": request.mode, **geometry, "warped_image_url": None}
+        
+        width, height = geometry["output_size"]
+        if width * height > WARP_MAX_PIXELS:
+            raise HTTPException(status_code=413, detail=f"Image redressée trop grande ({width}x{height})")
         
-        image = cv2.imread(str(image_path))
-        if image is None:
-            raise HTTPException(status_code=400, detail="Impossible de lire l'image")
+        # Charger l'image (upload ou volume partagé)
+        if request.path is not None:
+            image_path = resolve_shared_path(request.path)
+        elif request.image_path is not None:
+            image_path = storage.uploads.locate(Path(request.image_path).name)
+            if image_path is None:
+                raise HTTPException(status_code=404, detail="Image non trouvée")
+            storage.touch(image_path.name)
+        else:
+            raise HTTPException(status_code=400, detail="Fournir 'image_path' ou 'path'")
         
-        # Convertir les coins en numpy array
-        src_corners = np.array(request.marker_corners, dtype=np.float32)
+        decode_factor = await asyncio.to_thread(image_decode_factor, image_path)
+        result, stage_timings = await run_in_pool(run_warp, str(image_path), decode_factor, geometry)
+        observe_stages(stage_timings)
+        return {"mode": request.mode, **result}
         
-        # Calculer la taille de destination (A4 en pixels à 300 DPI)
-        # 210mm x 297mm à 300 DPI ≈ 2480 x 3508 pixels
-        dst_width = 2480
-        dst_height = 3508
+    except PoolSaturatedError as e:
+        raise pool_saturated_exception(e)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def frame_quality(frame: np.ndarray, corners: np.ndarray,
+                  motion: Optional[float]) -> Dict[str, Any]:
+    """
+    Qualité de cadrage d'une image du flux caméra, chaque critère entre 0 et 1 :
+    taille de la feuille, inclinaison (bords opposés de même longueur), marge
+    au bord de l'image, netteté des bords et stabilité depuis l'image précédente.
+    Retourne aussi les consignes à afficher à l'invité.
+    """
+    height, width = frame.shape[:2]
+    side = max(width, height)
+    
+    coverage = cv2.contourArea(corners.astype(np.float32)) / (width * height)
+    edges = np.linalg.norm(corners - np.roll(corners, -1, axis=0), axis=1)  # haut, droite, bas, gauche
+    keystone = (min(edges[0], edges[2]) / max(edges[0], edges[2])) * \
+               (min(edges[1], edges[3]) / max(edges[1], edges[3]))
+    margin = min(corners[:, 0].min(), corners[:, 1].min(),
+                 width - corners[:, 0].max(), height - corners[:, 1].max()) / side
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    sharpness = edge_sharpness(gray, corners)
+    
+    scores = {
+        # Feuille ni trop petite (mesures imprécises) ni trop grande (objets hors champ)
+        "coverage": float(np.clip(min((coverage - 0.05) / 0.10, (0.85 - coverage) / 0.15), 0, 1)),
+        "tilt": float(np.clip((keystone - 0.6) / 0.3, 0, 1)),
+        "margin": float(np.clip(margin / 0.02, 0, 1)),
+        "sharpness": float(np.clip(sharpness / 0.5, 0, 1)),
+        # Première image : mouvement inconnu
+        "stability": 0.5 if motion is None else float(np.clip(1 - motion / (0.01 * side), 0, 1)),
+    }
+    
+    hints = []
+    if coverage < 0.15:
+        hints.append("Rapprochez-vous de la feuille")
+    elif coverage > 0.7:
+        hints.append("Reculez : la feuille et les objets doivent tenir dans l'image")
+    if scores["margin"] < 1:
+        hints.append("La feuille touche le bord de l'image")
+    if scores["tilt"] < 0.8:
+        hints.append("Tenez le téléphone parallèle à la feuille")
+    if scores["sharpness"] < 0.6:
+        hints.append("Image floue : stabilisez l'appareil ou éclairez davantage")
+    if scores["stability"] < 0.5:
+        hints.append("Ne bougez plus")
+    
+    return {
+        # Moyenne géométrique : un seul critère nul suffit à rendre l'image inutilisable
+        "score": float(np.prod(list(scores.values())) ** (1 / len(scores))),
+        **scores,
+        "acceptable": not hints,
+        "hints": hints,
+    }
+
+class MarkerTracker:
+    """
+    Suivi du marqueur A4 d'une image à l'autre d'un flux caméra.
+    
+    Le quadrilatère est d'abord cherché dans une zone autour des coins de
+    l'image précédente ; la recherche sur toute l'image n'est relancée que
+    si le marqueur y est perdu.
+    """
+    
+    MIN_COVERAGE = 0.02  # aire minimale de la feuille (fraction de l'image)
+    SEARCH_MARGIN = 0.25  # zone de suivi : boîte des coins + 25 % de sa taille
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self) -> None:
+        self.corners: Optional[np.ndarray] = None
+        self.stable_frames = 0
+    
+    def search(self, frame: np.ndarray) -> Tuple[Optional[np.ndarray], bool]:
+        """Coins du marqueur et indicateur de suivi (True si trouvé près des précédents)."""
+        height, width = frame.shape[:2]
+        min_area = self.MIN_COVERAGE * width * height
         
-        # Calculer l'homographie
-        H = compute_homography(src_corners, (dst_width, dst_height))
+        if self.corners is not None:
+            (min_x, min_y), (max_x, max_y) = self.corners.min(axis=0), self.corners.max(axis=0)
+            margin = self.SEARCH_MARGIN * max(max_x - min_x, max_y - min_y)
+            x0, y0 = max(0, int(min_x - margin)), max(0, int(min_y - margin))
+            x1, y1 = min(width, int(max_x + margin) + 1), min(height, int(max_y + margin) + 1)
+            corners = find_a4_quad(frame[y0:y1, x0:x1], min_area)
+            if corners is not None:
+                return corners.astype(np.float32) + np.float32([x0, y0]), True
         
-        # Appliquer la transformation
-        warped = cv2.warpPerspective(image, H, (dst_width, dst_height))
+        corners = find_a4_quad(frame, min_area)
+        return (None if corners is None else corners.astype(np.float32)), False
+    
+    def update(self, frame: np.ndarray) -> Dict[str, Any]:
+        corners, tracked = self.search(frame)
+        if corners is None:
+            self.reset()
+            return {
+                "detected": False,
+                "tracked": False,
+                "corners": None,
+                "quality": None,
+                "good_to_capture": False,
+                "hints": ["Aucune feuille A4 détectée : cadrez la feuille entière"]
+            }
         
-        # Sauvegarder l'image transformée
-        filename = f"warped_{uuid.uuid4().hex}.jpg"
-        filepath = PROCESSED_DIR / filename
-        cv2.imwrite(str(filepath), warped)
+        corners = refine_corners(frame, corners, window=5)
+        motion = None
+        if self.corners is not None:
+            motion = float(np.linalg.norm(corners - self.corners, axis=1).max())
+        self.corners = corners
         
+        quality = frame_quality(frame, corners, motion)
+        self.stable_frames = self.stable_frames + 1 if quality["acceptable"] else 0
+        hints = quality.pop("hints")
+        quality.pop("acceptable")
         return {
-            "warped_image_url": f"/processed/{filename}",
-            "homography_matrix": H.tolist(),
-            "output_size": [dst_width, dst_height]
+            "detected": True,
+            "tracked": tracked,
+            "corners": corners,
+            "quality": quality,
+            "good_to_capture": self.stable_frames >= TRACK_STABLE_FRAMES,
+            "hints": hints
         }
+
+def track_frame(tracker: MarkerTracker, data: bytes) -> Dict[str, Any]:
+    """
+    Décoder une image du flux caméra, la réduire à TRACK_MAX_SIDE et suivre
+    le marqueur. Les coins sont renvoyés dans les coordonnées de l'image reçue.
+    """
+    timer = StageTimer()
+    with timer.stage("track_decode"):
+        # Image entière en mémoire : l'IFD d'un TIFF est trouvé où qu'il soit
+        header = sniff_image_header(data)
+        if header is None or header.format not in SUPPORTED_FORMATS:
+            raise InvalidImageError("Format d'image non supporté")
+        if header.pixels is None:
+            raise InvalidImageError("Dimensions de l'image introuvables")
+        if header.pixels > TRACK_MAX_FRAME_PIXELS:
+            raise InvalidImageError("Image trop grande pour le suivi")
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise InvalidImageError("Image illisible")
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        height, width = frame.shape[:2]
+        factor = max(1, int(np.ceil(max(height, width) / TRACK_MAX_SIDE)))
+        if factor > 1:
+            frame = cv2.resize(frame, None, fx=1.0 / factor, fy=1.0 / factor,
+                               interpolation=cv2.INTER_AREA)
+    
+    with timer.stage("track"):
+        result = tracker.update(frame)
+    if result["corners"] is not None:
+        result["corners"] = (result["corners"] * factor + (factor - 1) / 2.0).tolist()
+    result["frame_size"] = [width, height]
+    observe_stages(timer.timings)
+    return result
+
+class LatestFrame:
+    """
+    Boîte à une place pour les images d'une session de suivi : une image
+    arrivée avant le traitement de la précédente la remplace.
+    """
+    
+    def __init__(self):
+        self.data: Optional[bytes] = None
+        self.index = 0
+        self.received_at = 0.0
+        self.dropped = 0
+        self.closed = False
+        self.reset_requested = False
+        self._ready = asyncio.Event()
+    
+    def put(self, data: bytes) -> None:
+        if self.data is not None:
+            self.dropped += 1
+            TRACK_FRAMES.inc(result="superseded")
+        self.data = data
+        self.index += 1
+        self.received_at = time.perf_counter()
+        self._ready.set()
+    
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+    
+    async def take(self) -> Optional[Tuple[bytes, int, float]]:
+        """Attendre l'image la plus récente ; None quand le client s'est déconnecté."""
+        while self.data is None and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        if self.data is None:
+            return None
+        data, self.data = self.data, None
+        return data, self.index, self.received_at
+
+tracking_sessions = 0
+
+@app.websocket("/ws/track")
+async def track_marker(websocket: WebSocket):
+    """
+    Suivi du marqueur A4 en temps réel pour la vue caméra des invités.
+    
+    Le client envoie des images basse résolution (JPEG/WebP, messages
+    binaires) ; chaque image traitée reçoit un message JSON : coins,
+    qualité de cadrage, consignes et `good_to_capture`. Seule l'image la
+    plus récente est traitée : celles remplacées avant traitement ou plus
+    anciennes que AI_TRACK_BUDGET_MS sont ignorées et comptées dans `dropped`.
+    Le message texte `{"reset": true}` relance la recherche sur toute l'image.
+    """
+    global tracking_sessions
+    if tracking_sessions >= TRACK_MAX_SESSIONS:
+        # Fermée avant l'accept, la poignée de main serait refusée en HTTP 403
+        # et le client ne recevrait pas le code 1013 (réessayer plus tard)
+        await websocket.accept()
+        await websocket.close(code=1013)
+        return
+    
+    # Place réservée avant toute attente : des poignées de main simultanées
+    # ne peuvent pas toutes passer le contrôle ci-dessus
+    tracking_sessions += 1
+    try:
+        await websocket.accept()
+    except BaseException:
+        tracking_sessions -= 1
+        raise
+    tracker = MarkerTracker()
+    slot = LatestFrame()
+    
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    slot.put(message["bytes"])
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(control, dict) and control.get("reset"):
+                        slot.reset_requested = True
+        finally:
+            slot.close()
+    
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while (item := await slot.take()) is not None:
+            data, index, received_at = item
+            if (time.perf_counter() - received_at) * 1000 > TRACK_BUDGET_MS:
+                slot.dropped += 1
+                TRACK_FRAMES.inc(result="stale")
+                continue
+            if slot.reset_requested:
+                slot.reset_requested = False
+                tracker.reset()
+            
+            if len(data) > TRACK_MAX_FRAME_BYTES:
+                reply = {"error": f"Image trop volumineuse (maximum {TRACK_MAX_FRAME_BYTES} octets)"}
+                TRACK_FRAMES.inc(result="invalid")
+            else:
+                try:
+                    reply = await asyncio.to_thread(track_frame, tracker, data)
+                    TRACK_FRAMES.inc(result="tracked" if reply["tracked"] else "searched")
+                except InvalidImageError as e:
+                    reply = {"error": str(e)}
+                    TRACK_FRAMES.inc(result="invalid")
+            
+            if slot.closed:
+                break
+            reply["frame"] = index
+            reply["dropped"] = slot.dropped
+            reply["latency_ms"] = round((time.perf_counter() - received_at) * 1000, 1)
+            slot.dropped = 0
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        tracking_sessions -= 1
+
+def synthetic_scene(width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Photo synthétique pour le préchauffage : feuille A4 légèrement tournée
+    sur un fond bruité, et un objet sombre à côté pour les suggestions.
+    Retourne l'image et les coins de la feuille.
+    """
+    rng = np.random.default_rng(0)
+    image = rng.integers(100, 130, (height, width, 3), dtype=np.uint8)
+    
+    scale = 0.6 * height / A4_LONG_MM
+    half = np.array([A4_SHORT_MM, A4_LONG_MM]) * scale / 2
+    angle = np.deg2rad(4.0)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * half @ rotation.T
+    corners += np.array([0.35 * width, 0.5 * height])
+    cv2.fillConvexPoly(image, np.round(corners).astype(np.int32), (245, 245, 245), cv2.LINE_AA)
+    
+    cv2.rectangle(image, (int(0.6 * width), int(0.3 * height)), (int(0.8 * width), int(0.55 * height)),
+                  (60, 50, 40), -1)
+    return image, corners
+
+def warm_up_pipeline() -> Dict[str, float]:
+    """
+    Préchauffage d'un worker du pool (voir executor.py) : analyse complète
+    d'une photo synthétique, rendu de l'annotation et de sa miniature, et
+    redressement. Les premiers appels OpenCV (allocateurs, noyaux, codecs
+    JPEG/WebP) sont payés ici plutôt que par la première vraie requête.
+    Rien n'est laissé dans processed/ ni dans le cache des images décodées.
+    Retourne la durée des étapes (s).
+    """
+    timer = StageTimer()
+    image, _ = synthetic_scene(2048, 1536)
+    created: List[Any] = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="menui-warmup-") as tmp:
+            path = os.path.join(tmp, "warmup.jpg")
+            with timer.stage("encode"):
+                ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            with open(path, "wb") as f:
+                f.write(encoded.tobytes())
+            
+            # Décodage réduit, utilisé pour les grandes photos
+            with timer.stage("decode_reduced"):
+                read_image(path, REDUCED_DECODE_FLAGS[2])
+            
+            # Image jetable : elle ne doit pas occuper le cache des images décodées
+            result, stats = run_analysis(path, cache_decoded=False)
+            timer.update(stats["timings"])
+            annotation = annotation_renderer.parse(Path(result["annotated_image_url"]).name)
+            if annotation is not None:
+                created.append((annotation_renderer.specs, f"{annotation[0]}.json"))
+                for thumbnail in (False, True):
+                    filename = annotation_renderer.filename(annotation[0], thumbnail)
+                    created.append((storage.processed, filename))
+                    rendered, timings = render_annotation(filename, cache_decoded=False)
+                    timer.update(timings)
+            if not stats["detected"]:
+                raise RuntimeError("Feuille A4 non détectée sur l'image de préchauffage")
+            
+            geometry = warp_geometry(WarpRequest(marker_corners=result["marker"]["corners"], dpi=100))
+            warped, timings = run_warp(path, 1, geometry, cache_decoded=False)
+            created.append((storage.processed, Path(warped["warped_image_url"]).name))
+            timer.update(timings)
+    finally:
+        for directory, name in created:
+            directory.remove(name)
+    return timer.timings
+
+def warm_up_service() -> Dict[str, float]:
+    """
+    Préchauffage du processus du service, qui exécute lui-même le suivi
+    temps réel (/ws/track) et /measure. Retourne la durée des étapes (s).
+    """
+    timer = StageTimer()
+    image, corners = synthetic_scene(640, 480)
+    with timer.stage("track"):
+        ok, encoded = cv2.imencode(".jpg", image)
+        frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        MarkerTracker().update(frame)
+    with timer.stage("measure"):
+        measure_shapes(corners, [corners[:2], corners], ["length", "area"])
+    return timer.timings
+
+# Préchauffage de chaque worker à son démarrage (AI_WARMUP_ENABLED)
+if WARMUP_ENABLED:
+    executor.warmup = warm_up_pipeline
+
+def process_uptime() -> Optional[float]:
+    """Secondes écoulées depuis le lancement du processus (Linux), sinon None."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Champs après le nom de la commande ; starttime est le 22e champ
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+async def warm_up() -> None:
+    """
+    Préchauffer les workers et le service, puis ouvrir /ready. Un échec
+    du préchauffage est rapporté mais n'empêche pas le service de servir.
+    """
+    start = time.perf_counter()
+    errors = []
+    workers: List[Dict[str, Any]] = []
+    if WARMUP_ENABLED:
+        try:
+            workers = await executor.warm_up(WARMUP_TIMEOUT_SECONDS)
+            service_timings = await asyncio.to_thread(warm_up_service)
+            observe_stages({f"warmup_{stage}": seconds for stage, seconds in service_timings.items()})
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        errors += [worker["error"] for worker in workers if worker["error"]]
+        if executor.mode == "process" and len(workers) < executor.workers:
+            errors.append(f"{len(workers)}/{executor.workers} workers préchauffés avant le délai")
+    
+    startup_state["warmup_seconds"] = time.perf_counter() - start
+    startup_state["workers"] = [
+        {"pid": worker["pid"], "seconds": round(worker["seconds"], 3),
+         "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in (worker["result"] or {}).items()}}
+        for worker in workers
+    ]
+    startup_state["errors"] = errors
+    uptime = process_uptime()
+    startup_state["total_seconds"] = (
+        uptime if uptime is not None else time.perf_counter() - MODULE_IMPORT_STARTED
+    )
+    startup_state["ready"] = True
+    for phase in ("import", "setup", "warmup", "total"):
+        STARTUP_SECONDS.set(startup_state[f"{phase}_seconds"], phase=phase)
+
+@app.get("/ready")
+async def readiness():
+    """
+    Disponibilité du service : 503 tant que le préchauffage n'est pas terminé,
+    puis 200 avec la durée du démarrage (import, initialisation, préchauffage,
+    total depuis le lancement du processus).
+    """
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    
+    return {
+        "status": "ready",
+        "startup": {
+            **{f"{phase}_ms": round(startup_state[f"{phase}_seconds"] * 1000, 1)
+               for phase in ("import", "setup", "warmup", "total")},
+            "workers": startup_state["workers"],
+            "errors": startup_state["errors"],
+        }
+    }
 
 if __name__ == "__main__":
     import uvicorn
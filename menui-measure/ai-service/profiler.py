@@ -0,0 +1,90 @@
+"""
+Profileur par échantillonnage, activable à chaud.
+
+Un thread relève la pile de chaque thread du processus toutes les
+`interval` secondes et compte les piles identiques. Le résultat est au
+format "collapsed" (une ligne `fonction;fonction;... nombre` par pile),
+lisible par flamegraph.pl ou speedscope.
+
+Les traitements du pool s'exécutent dans d'autres processus :
+`profiled_call` les enveloppe pour y échantillonner le temps de la tâche
+et renvoyer les piles avec son résultat.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Optional, Tuple
+
+
+def _collapse(frame: Any) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.started_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.active:
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """Arrêter l'échantillonnage et retourner les piles relevées."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            samples, self.samples = self.samples, Counter()
+        return samples
+
+    def merge(self, samples: Counter) -> None:
+        """Ajouter des piles relevées ailleurs (worker du pool)."""
+        with self._lock:
+            self.samples.update(samples)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = [
+                _collapse(frame)
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id
+            ]
+            with self._lock:
+                self.samples.update(stacks)
+
+
+def collapsed(samples: Counter) -> str:
+    """Piles au format "collapsed", les plus fréquentes d'abord."""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def profiled_call(interval: float, fn: Callable[..., Any], *args: Any) -> Tuple[Any, Counter]:
+    """Exécuter `fn(*args)` en l'échantillonnant ; retourne (résultat, piles)."""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        result = fn(*args)
+    finally:
+        samples = profiler.stop()
+    return result, samples
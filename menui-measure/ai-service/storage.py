@@ -0,0 +1,350 @@
+"""
+Stockage des fichiers servis : uploads/ et processed/.
+
+Les fichiers sont répartis dans des sous-répertoires dérivés du hachage de
+leur nom (`<racine>/ab/cd/<nom>`) : aucun répertoire ne grossit sans borne,
+et le nom suffit à retrouver le fichier, les URL `/uploads/<nom>` et
+`/processed/<nom>` ne changent donc pas. Les fichiers de l'ancienne
+disposition à plat restent servis et sont nettoyés comme les autres.
+
+Un artefact dérivé (image annotée et sa miniature, image redressée) est
+rattaché à l'upload dont il provient par un fichier de référence
+(`processed/.refs`). Le nettoyage traite un upload et ses artefacts comme
+un seul groupe, dont l'usage est la date la plus récente de ses fichiers.
+Quand un groupe n'a pas servi depuis `ttl_seconds`, seul l'upload est
+supprimé, sauf si une image annotée ou sa miniature reste à rendre à
+partir de lui : les URL des artefacts sont conservées par Laravel et doivent
+rester valides. Les artefacts ne sont supprimés que par le quota : groupes
+entiers, les moins récemment utilisés d'abord, tant que la taille totale
+dépasse `max_bytes`.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_SHARD = re.compile(r"^[0-9a-f]{2}$")
+
+# Nom de base d'un artefact : la miniature et la description d'une image
+# annotée appartiennent au même groupe que l'image
+_ARTIFACT = re.compile(r"^((?:annotated|warped)_[0-9a-f]{32})")
+
+
+def artifact_key(filename: str) -> str:
+    """Nom de base de l'artefact auquel appartient un fichier de processed/."""
+    match = _ARTIFACT.match(filename)
+    return match.group(1) if match else filename
+
+
+def _valid_name(name: str) -> bool:
+    return bool(name) and Path(name).name == name and not name.startswith(".")
+
+
+class ShardedDirectory:
+    """Fichiers d'un répertoire, répartis sur deux niveaux de sous-répertoires."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    @staticmethod
+    def shard(name: str) -> str:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return f"{digest[:2]}/{digest[2:4]}"
+
+    def relative(self, name: str) -> str:
+        return f"{self.shard(name)}/{name}"
+
+    def path(self, name: str) -> Path:
+        """Emplacement d'un fichier dans la disposition répartie."""
+        return self.root / self.relative(name)
+
+    def create_path(self, name: str) -> Path:
+        """Emplacement d'un nouveau fichier, son sous-répertoire étant créé."""
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def locate(self, name: str) -> Optional[Path]:
+        """Fichier existant, réparti ou à plat ; None si absent ou nom invalide."""
+        if not _valid_name(name):
+            return None
+        for path in (self.path(name), self.root / name):
+            if path.is_file():
+                return path
+        return None
+
+    def remove(self, name: str) -> None:
+        """Supprimer un fichier, réparti ou à plat, s'il existe."""
+        path = self.locate(name)
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+    def files(self) -> Iterator[Tuple[str, str, os.stat_result]]:
+        """(nom, chemin, stat) de chaque fichier ; les entrées cachées sont ignorées."""
+        if not self.root.is_dir():
+            return
+        for entry in os.scandir(self.root):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_file(follow_symlinks=False):
+                yield from _stat_entry(entry)
+            elif entry.is_dir(follow_symlinks=False) and _SHARD.match(entry.name):
+                for sub in os.scandir(entry.path):
+                    if not (sub.is_dir(follow_symlinks=False) and _SHARD.match(sub.name)):
+                        continue
+                    for item in os.scandir(sub.path):
+                        if not item.name.startswith(".") and item.is_file(follow_symlinks=False):
+                            yield from _stat_entry(item)
+
+
+def _stat_entry(entry: "os.DirEntry[str]") -> Iterator[Tuple[str, str, os.stat_result]]:
+    try:
+        yield entry.name, entry.path, entry.stat(follow_symlinks=False)
+    except OSError:
+        # Supprimé entre le listage et le stat
+        return
+
+
+@dataclass
+class _Group:
+    """Un upload et ses artefacts, ou un artefact sans upload (volume partagé)."""
+
+    last_used: float = 0.0
+    size: int = 0
+    paths: List[Tuple[str, str, int]] = field(default_factory=list)  # (zone, chemin, taille)
+    pending: bool = False  # image annotée ou miniature pas encore rendue (l'upload source reste nécessaire)
+
+    def add(self, area: str, path: str, stat: os.stat_result) -> None:
+        self.paths.append((area, path, stat.st_size))
+        self.size += stat.st_size
+        self.last_used = max(self.last_used, stat.st_mtime)
+
+
+class StorageManager:
+    """
+    uploads/ et processed/, avec les références entre uploads et artefacts
+    et le nettoyage par âge des uploads (`ttl_seconds`) et par taille
+    (`max_bytes`). Une valeur nulle désactive la limite correspondante. Les
+    groupes utilisés depuis moins de `grace_seconds` ne sont jamais supprimés.
+    """
+
+    def __init__(
+        self,
+        uploads: Path,
+        processed: Path,
+        max_bytes: int = 10 * 1024 * 1024 * 1024,
+        ttl_seconds: float = 30 * 24 * 3600,
+        grace_seconds: float = 600,
+        interval_seconds: float = 3600,
+    ):
+        self.uploads = ShardedDirectory(uploads)
+        self.processed = ShardedDirectory(processed)
+        self.specs = ShardedDirectory(Path(processed) / ".pending")
+        self.refs = ShardedDirectory(Path(processed) / ".refs")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self.interval_seconds = interval_seconds
+        self.last_report: Optional[Dict[str, Any]] = None
+        # Index des références (artefact -> (mtime_ns, upload)), conservé
+        # d'une passe à l'autre : seules les références nouvelles ou
+        # réécrites sont relues
+        self._ref_index: Dict[str, Tuple[int, str]] = {}
+
+    @classmethod
+    def from_env(cls, uploads: Path, processed: Path) -> "StorageManager":
+        """Construire le stockage à partir des variables d'environnement AI_STORAGE_*."""
+        return cls(
+            uploads=uploads,
+            processed=processed,
+            max_bytes=int(float(os.getenv("AI_STORAGE_MAX_MB", "10240")) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("AI_STORAGE_TTL_HOURS", "720")) * 3600,
+            grace_seconds=float(os.getenv("AI_STORAGE_GRACE_MINUTES", "10")) * 60,
+            interval_seconds=float(os.getenv("AI_STORAGE_GC_INTERVAL_MINUTES", "60")) * 60,
+        )
+
+    def link(self, artifact: str, upload_path: str) -> None:
+        """
+        Rattacher un artefact à l'upload `upload_path`. Sans effet si l'image
+        source n'est pas un upload (volume partagé) : l'artefact forme alors
+        un groupe à lui seul.
+        """
+        upload = Path(upload_path)
+        if not upload.resolve().is_relative_to(self.uploads.root.resolve()):
+            return
+        path = self.refs.create_path(artifact_key(artifact))
+        tmp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(upload.name, encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def touch(self, upload: str) -> None:
+        """Marquer un upload (et donc son groupe) comme récemment utilisé."""
+        path = self.uploads.locate(upload)
+        if path is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _groups(self) -> Tuple[Dict[str, _Group], Dict[str, Dict[str, int]]]:
+        """Parcourir le stockage : groupes et usage (fichiers, octets) par zone."""
+        usage = {area: {"files": 0, "bytes": 0} for area in ("uploads", "processed", "metadata")}
+        groups: Dict[str, _Group] = {}
+
+        def add(key: str, area: str, path: str, stat: os.stat_result) -> None:
+            groups.setdefault(key, _Group()).add(area, path, stat)
+            usage[area]["files"] += 1
+            usage[area]["bytes"] += stat.st_size
+
+        uploads = set()
+        for name, path, stat in self.uploads.files():
+            uploads.add(name)
+            add(f"upload:{name}", "uploads", path, stat)
+
+        refs = list(self.refs.files())
+        index: Dict[str, Tuple[int, str]] = {}
+        for name, path, stat in refs:
+            known = self._ref_index.get(name)
+            if known is not None and known[0] == stat.st_mtime_ns:
+                index[name] = known
+                continue
+            try:
+                index[name] = (stat.st_mtime_ns, Path(path).read_text(encoding="utf-8").strip())
+            except OSError:
+                continue
+        self._ref_index = index
+        parents = {name: parent for name, (_, parent) in index.items()}
+
+        def owner(artifact: str) -> str:
+            parent = parents.get(artifact)
+            return f"upload:{parent}" if parent in uploads else f"artifact:{artifact}"
+
+        # Variantes déjà rendues de chaque artefact (image, miniature)
+        rendered: Dict[str, set] = {}
+        for name, path, stat in self.processed.files():
+            artifact = artifact_key(name)
+            add(owner(artifact), "processed", path, stat)
+            rendered.setdefault(artifact, set()).add(name[len(artifact):].startswith("_thumb."))
+        for name, path, stat in self.specs.files():
+            artifact = artifact_key(name)
+            key = owner(artifact)
+            add(key, "metadata", path, stat)
+            # La description est conservée après le rendu : l'upload source
+            # n'est nécessaire que tant qu'une des deux variantes manque
+            if rendered.get(artifact, set()) != {False, True}:
+                groups[key].pending = True
+        for name, path, stat in refs:
+            add(owner(name), "metadata", path, stat)
+
+        return groups, usage
+
+    def _remove(self, group: _Group, cutoff: float,
+                areas: Optional[Tuple[str, ...]] = None) -> Optional[List[Tuple[str, str, int]]]:
+        """
+        Supprimer les fichiers d'un groupe (ceux des zones `areas`, tous par
+        défaut) s'il n'a pas servi depuis `cutoff` (vérifié à nouveau : une
+        requête a pu l'utiliser depuis le parcours).
+        Retourne les fichiers supprimés, None si le groupe est conservé.
+        """
+        for _, path, _ in group.paths:
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    return None
+            except OSError:
+                continue
+        # L'upload en dernier : un artefact n'est jamais laissé sans référence
+        removed = []
+        for item in sorted(group.paths, key=lambda item: item[0] == "uploads"):
+            if areas is not None and item[0] not in areas:
+                continue
+            try:
+                os.unlink(item[1])
+                removed.append(item)
+            except OSError:
+                continue
+        return removed
+
+    def _remove_stale_temporaries(self, cutoff: float) -> None:
+        """Fichiers temporaires laissés par une écriture interrompue."""
+        for directory in (self.uploads.root, self.processed.root, self.specs.root, self.refs.root):
+            for parent, _, names in os.walk(directory):
+                for name in names:
+                    if not (name.startswith(".") and name.endswith(".tmp")):
+                        continue
+                    path = os.path.join(parent, name)
+                    try:
+                        if os.stat(path).st_mtime < cutoff:
+                            os.unlink(path)
+                    except OSError:
+                        continue
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Supprimer les uploads des groupes expirés (sauf image annotée ou
+        miniature pas encore rendue), puis les groupes les moins récemment utilisés tant que la
+        taille totale dépasse `max_bytes`. Retourne le rapport d'usage (après
+        nettoyage), également conservé dans `last_report`.
+        """
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        grace_cutoff = now - self.grace_seconds
+        groups, usage = self._groups()
+
+        reaped = {"ttl": {"groups": 0, "bytes": 0}, "quota": {"groups": 0, "bytes": 0}}
+
+        def reap(key: str, reason: str, cutoff: float, areas: Optional[Tuple[str, ...]] = None) -> None:
+            group = groups[key]
+            removed = self._remove(group, cutoff, areas)
+            if not removed:
+                return
+            for area, _, size in removed:
+                usage[area]["files"] -= 1
+                usage[area]["bytes"] -= size
+            group.paths = [item for item in group.paths if item not in removed]
+            group.size = sum(size for _, _, size in group.paths)
+            if not group.paths:
+                del groups[key]
+            reaped[reason]["groups"] += 1
+            reaped[reason]["bytes"] += sum(size for _, _, size in removed)
+
+        if self.ttl_seconds > 0:
+            # Uploads seulement : les artefacts restent servis (URL conservées par Laravel)
+            ttl_cutoff = min(now - self.ttl_seconds, grace_cutoff)
+            expired = [
+                key for key, group in groups.items()
+                if group.last_used < ttl_cutoff and not group.pending
+                and any(area == "uploads" for area, _, _ in group.paths)
+            ]
+            for key in expired:
+                reap(key, "ttl", ttl_cutoff, areas=("uploads",))
+
+        total = sum(area["bytes"] for area in usage.values())
+        if self.max_bytes > 0 and total > self.max_bytes:
+            for key in sorted(groups, key=lambda key: groups[key].last_used):
+                if sum(area["bytes"] for area in usage.values()) <= self.max_bytes:
+                    break
+                if groups[key].last_used >= grace_cutoff:
+                    break
+                reap(key, "quota", grace_cutoff)
+
+        self._remove_stale_temporaries(grace_cutoff)
+
+        oldest = min((group.last_used for group in groups.values()), default=None)
+        self.last_report = {
+            "scanned_at": datetime.fromtimestamp(now).isoformat(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            "areas": usage,
+            "total_bytes": sum(area["bytes"] for area in usage.values()),
+            "groups": len(groups),
+            "orphan_artifacts": sum(1 for key in groups if key.startswith("artifact:")),
+            "oldest_use": datetime.fromtimestamp(oldest).isoformat() if oldest is not None else None,
+            "reaped": reaped,
+            "max_bytes": self.max_bytes,
+            "ttl_hours": self.ttl_seconds / 3600,
+        }
+        return self.last_report
@@ -0,0 +1,102 @@
+"""
+Tests de fusion.py sur des mesures synthétiques (sans image ni OpenCV).
+
+    python -m pytest test_fusion.py
+"""
+import numpy as np
+
+from fusion import (
+    OUTLIER_Z,
+    FrameMeasure,
+    alignment_cost,
+    fuse_measures,
+    match_measures,
+    robust_z,
+    student_t975,
+)
+
+PLANE_MM = np.array([210.0, 297.0])
+
+# Zones de la scène : type, valeur vraie, contour sur le plan (mm)
+ZONES = [
+    ("area", 50.0 * 40.0, np.array([[20, 30], [70, 30], [70, 70], [20, 70]], dtype=float)),
+    ("area", 100.0 * 80.0, np.array([[60, 150], [160, 150], [160, 230], [60, 230]], dtype=float)),
+    ("length", 120.0, np.array([[40, 260], [160, 260]], dtype=float)),
+]
+
+# Écart relatif de chaque photo (la dernière surestime tout de 30 %)
+FRAME_ERRORS = [0.004, -0.003, 0.001, -0.002, 0.3]
+
+
+def synthetic_measures():
+    rng = np.random.default_rng(0)
+    measures = []
+    for frame, error in enumerate(FRAME_ERRORS):
+        for kind, value, points in ZONES:
+            shifted = points + rng.normal(0.0, 1.0, points.shape)
+            measures.append(FrameMeasure(
+                frame=frame,
+                type=kind,
+                value=value * (1 + error),
+                uncertainty=value * 0.002,
+                confidence=0.8,
+                plane_points=shifted,
+            ))
+    return measures
+
+
+def test_student_t975():
+    assert student_t975(0) == float("inf")
+    assert student_t975(1) == 12.706
+    assert student_t975(4) == 2.776
+    assert student_t975(1000) == 1.96
+
+
+def test_robust_z_ignores_the_outlier_in_its_scale():
+    z = robust_z(np.array([10.0, 10.1, 9.9, 10.0, 20.0]), floor=0.0)
+    assert z[4] > OUTLIER_Z
+    assert np.all(z[:4] < 2)
+
+
+def test_match_measures_groups_one_measure_per_frame():
+    measures = synthetic_measures()
+    groups = match_measures(measures)
+    assert len(groups) == len(ZONES)
+    for members in groups:
+        assert sorted(measures[i].frame for i in members) == list(range(len(FRAME_ERRORS)))
+        assert len({measures[i].type for i in members}) == 1
+
+
+def test_fuse_measures_rejects_outlier_frame():
+    result = fuse_measures(synthetic_measures(), len(FRAME_ERRORS))
+    assert result["outlier_frames"] == [4]
+    assert result["scores"][4] > OUTLIER_Z
+    assert len(result["measurements"]) == len(ZONES)
+
+    for kind, value, _ in ZONES:
+        match = [m for m in result["measurements"] if m["type"] == kind and abs(m["value"] - value) < 0.02 * value]
+        assert len(match) == 1
+        measurement = match[0]
+        assert measurement["frames"] == [0, 1, 2, 3]
+        low, high = measurement["ci95"]
+        assert low < value < high
+
+        # Intervalle de Student à 3 degrés de liberté autour de la moyenne
+        values = np.array([value * (1 + e) for e in FRAME_ERRORS[:4]])
+        assert np.isclose(measurement["value"], values.mean())
+        assert np.isclose(measurement["std"], values.std(ddof=1))
+        assert measurement["standard_error"] >= values.std(ddof=1) / 2
+        assert np.isclose(high - measurement["value"], student_t975(3) * measurement["standard_error"])
+
+
+def test_alignment_cost_prefers_the_matching_orientation():
+    measures = synthetic_measures()
+    reference = [m for m in measures if m.frame == 0]
+    other = [m for m in measures if m.frame == 1]
+    flipped = [
+        FrameMeasure(m.frame, m.type, m.value, m.uncertainty, m.confidence, PLANE_MM - m.plane_points)
+        for m in other
+    ]
+    assert alignment_cost(other, reference) < 0.1
+    assert alignment_cost(flipped, reference) > 1.0
+    assert alignment_cost(other, []) == 0.0
@@ -0,0 +1,70 @@
+"""
+Tests du nettoyage de storage.py sur un stockage temporaire.
+
+    python -m pytest test_storage.py
+"""
+import os
+import time
+
+from storage import ShardedDirectory, StorageManager
+
+HOUR = 3600.0
+
+
+def make_storage(tmp_path):
+    return StorageManager(
+        uploads=tmp_path / "uploads",
+        processed=tmp_path / "processed",
+        max_bytes=0,
+        ttl_seconds=HOUR,
+        grace_seconds=60,
+    )
+
+
+def write(directory: ShardedDirectory, name: str, mtime: float) -> None:
+    path = directory.create_path(name)
+    path.write_bytes(b"x" * 16)
+    os.utime(path, (mtime, mtime))
+
+
+def analyzed_upload(storage, artifact, mtime, rendered):
+    """Un upload analysé : référence, description et variantes `rendered` de l'annotation."""
+    upload = f"{artifact}_source.jpg"
+    write(storage.uploads, upload, mtime)
+    storage.link(artifact, str(storage.uploads.path(upload)))
+    os.utime(storage.refs.path(artifact), (mtime, mtime))
+    write(storage.specs, f"{artifact}.json", mtime)
+    for filename in rendered:
+        write(storage.processed, filename, mtime)
+    return upload
+
+
+def test_ttl_reaps_upload_once_annotation_and_thumbnail_are_rendered(tmp_path):
+    storage = make_storage(tmp_path)
+    aged = time.time() - 10 * HOUR
+    artifact = "annotated_" + "a" * 32
+    upload = analyzed_upload(storage, artifact, aged, [f"{artifact}.jpg", f"{artifact}_thumb.jpg"])
+
+    report = storage.collect()
+
+    assert report["reaped"]["ttl"]["groups"] == 1
+    assert storage.uploads.locate(upload) is None
+    assert storage.processed.locate(f"{artifact}.jpg") is not None
+    assert storage.processed.locate(f"{artifact}_thumb.jpg") is not None
+
+
+def test_ttl_keeps_upload_while_a_variant_is_missing(tmp_path):
+    storage = make_storage(tmp_path)
+    aged = time.time() - 10 * HOUR
+    unrendered = "annotated_" + "b" * 32
+    partial = "annotated_" + "c" * 32
+    kept = [
+        analyzed_upload(storage, unrendered, aged, []),
+        analyzed_upload(storage, partial, aged, [f"{partial}.jpg"]),
+    ]
+
+    report = storage.collect()
+
+    assert report["reaped"]["ttl"]["groups"] == 0
+    for upload in kept:
+        assert storage.uploads.locate(upload) is not None
@@ -69,6 +69,8 @@ class MeasurementController extends Controller
         if ($validated['type'] === 'length') {
             if (isset($validated['value_mm'])) {
                 $measurementData['value_mm'] = $validated['value_mm'];
+            } elseif ($aiMeasure = $this->measureWithAiService($photo, 'length', $validated['points'])) {
+                $measurementData['value_mm'] = $aiMeasure['value_mm'];
             } else {
                 // Calculer la distance entre deux points
                 $p1 = $validated['points'][0];
@@ -82,6 +84,9 @@ class MeasurementController extends Controller
             if (isset($validated['value_mm2']) && isset($validated['value_m2'])) {
                 $measurementData['value_mm2'] = $validated['value_mm2'];
                 $measurementData['value_m2'] = $validated['value_m2'];
+            } elseif ($aiMeasure = $this->measureWithAiService($photo, 'area', $validated['points'])) {
+                $measurementData['value_mm2'] = $aiMeasure['value_mm2'];
+                $measurementData['value_m2'] = $aiMeasure['value_m2'];
             } else {
                 // Calculer l'aire du polygone
                 $areaPx = $this->calculatePolygonArea($validated['points']);
@@ -149,6 +154,36 @@ class MeasurementController extends Controller
         ]);
     }
 
+    /**
+     * Calculer une mesure via l'endpoint /measure du service IA, qui projette
+     * les points sur le plan de la feuille A4 (correction de perspective).
+     * Retourne null si le service ou les coins du marqueur ne sont pas disponibles.
+     */
+    private function measureWithAiService(Photo $photo, string $type, array $points): ?array
+    {
+        $aiServiceUrl = config('services.ai.url');
+        $corners = $photo->metadata['marker']['corners'] ?? null;
+
+        if (!$aiServiceUrl || $aiServiceUrl === 'http://localhost:8000' || !$corners) {
+            return null;
+        }
+
+        try {
+            $response = Http::timeout(config('services.ai.timeout', 60))
+                ->post($aiServiceUrl . '/measure', [
+                    'marker_corners' => $corners,
+                    'shapes' => [[
+                        'type' => $type,
+                        'points' => array_map(fn ($point) => [(float) $point['x'], (float) $point['y']], $points),
+                    ]],
+                ]);
+
+            return $response->successful() ? $response->json('measurements.0') : null;
+        } catch (\Exception $e) {
+            return null;
+        }
+    }
+
     /**
      * Calculer l'aire d'un polygone.
      */
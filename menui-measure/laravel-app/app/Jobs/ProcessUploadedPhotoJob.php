@@ -70,19 +70,31 @@ class ProcessUploadedPhotoJob implements ShouldQueue
                 return;
             }
 
-            // Préparer le fichier pour l'envoi
-            $filePath = Storage::disk('public')->path($this->photo->path);
-            
+            $metadata = json_encode([
+                'expect_marker' => 'A4',
+                'photo_id' => $this->photo->id,
+                'task_id' => $this->photo->task_id,
+            ]);
+
             // Appeler le service IA
-            $response = Http::timeout(60)
-                ->attach('file', file_get_contents($filePath), $this->photo->filename)
-                ->post($aiServiceUrl . '/analyze', [
-                    'metadata' => json_encode([
-                        'expect_marker' => 'A4',
-                        'photo_id' => $this->photo->id,
-                        'task_id' => $this->photo->task_id,
-                    ])
-                ]);
+            if (config('services.ai.shared_storage')) {
+                // Volume partagé : le service lit la photo sur place, sans transfert HTTP
+                $response = Http::timeout(60)
+                    ->asForm()
+                    ->post($aiServiceUrl . '/analyze', [
+                        'path' => $this->photo->path,
+                        'metadata' => $metadata,
+                    ]);
+            } else {
+                // Préparer le fichier pour l'envoi
+                $filePath = Storage::disk('public')->path($this->photo->path);
+
+                $response = Http::timeout(60)
+                    ->attach('file', fopen($filePath, 'r'), $this->photo->filename)
+                    ->post($aiServiceUrl . '/analyze', [
+                        'metadata' => $metadata,
+                    ]);
+            }
 
             if (!$response->successful()) {
                 throw new Exception("Erreur du service IA: " . $response->body());
@@ -111,7 +123,7 @@ class ProcessUploadedPhotoJob implements ShouldQueue
                         'value_m2' => $measurement['value_m2'] ?? null,
                         'points' => $data['suggestions'][$measurement['id']]['mask_poly'] ?? [],
                         'confidence' => $measurement['confidence'],
-                        'processor_version' => '1.0.0',
+                        'processor_version' => $data['processor_version'] ?? '1.0.0',
                         'annotated_path' => $data['annotated_image_url'],
                     ]);
                 }
@@ -32,6 +32,8 @@ return [
     'ai' => [
         'url' => env('AI_SERVICE_URL', 'http://ai-service:8000'),
         'timeout' => env('AI_SERVICE_TIMEOUT', 60),
+        // Le service IA monte storage/app/public (AI_SHARED_ROOT) : envoyer le chemin plutôt que le fichier
+        'shared_storage' => env('AI_SHARED_STORAGE', false),
     ],
 
     'ovh' => [